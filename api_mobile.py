@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_db_leitura
 from models import Produto, Categoria, Usuario
 from auth_deps import get_usuario_atual
+from catalogo import obter_pagina_produtos, obter_produto, PAGINA_PADRAO, PAGINA_MAXIMA
+from pedidos import carregar_carrinho, aplicar_delta_carrinho, aplicar_delta_item, registrar_pedido_novo
+from estoque import estoque_disponivel, reservar_item
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -20,6 +24,10 @@ class ProdutoResponse(BaseModel):
     categoria_id: Optional[int] = None
     categoria_nome: Optional[str] = None
 
+class ProdutoPaginaResponse(BaseModel):
+    itens: List[ProdutoResponse]
+    next_cursor: Optional[int] = None
+
 class CategoriaResponse(BaseModel):
     id: int
     nome: str
@@ -40,81 +48,85 @@ class LoginResponse(BaseModel):
     usuario: Optional[UsuarioResponse] = None
     message: str
 
+def _produto_response(p: dict) -> ProdutoResponse:
+    """Converte a fotografia do catálogo (dict) no modelo de resposta"""
+    return ProdutoResponse(
+        id=p["id"],
+        nome=p["nome"],
+        preco=p["preco"],
+        descricao=p["descricao"],
+        imagem=f"/static/uploads/{p['imagem']}" if p["imagem"] else None,
+        cor=p["cor"],
+        tamanho=p["tamanho"],
+        categoria_id=p["categoria_id"],
+        categoria_nome=p["categoria"]["nome"] if p["categoria"] else None
+    )
+
 # ✅ ENDPOINT: Listar produtos (JSON)
-@router.get("/produtos", response_model=List[ProdutoResponse])
+@router.get("/produtos", response_model=ProdutoPaginaResponse)
 def listar_produtos_mobile(
-    db: Session = Depends(get_db),
-    categoria_id: Optional[int] = None
+    db: Session = Depends(get_db_leitura),
+    categoria_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limite: int = Query(PAGINA_PADRAO, ge=1, le=PAGINA_MAXIMA)
 ):
-    """Retorna lista de produtos em JSON"""
-    query = db.query(Produto)
-    
-    if categoria_id:
-        query = query.filter(Produto.categoria_id == categoria_id)
-    
-    produtos = query.all()
-    
-    resultado = []
-    for p in produtos:
-        resultado.append(ProdutoResponse(
-            id=p.id,
-            nome=p.nome,
-            preco=float(p.preco),
-            descricao=p.descricao,
-            imagem=f"/static/uploads/{p.imagem}" if p.imagem else None,
-            cor=p.cor,
-            tamanho=p.tamanho,
-            categoria_id=p.categoria_id,
-            categoria_nome=p.categoria.nome if p.categoria else None
-        ))
-    
-    return resultado
+    """Retorna uma página de produtos em JSON (use next_cursor para a próxima)"""
+    pagina = obter_pagina_produtos(db, cursor, limite, categoria_id)
+    
+    resultado = [_produto_response(p) for p in pagina["produtos"]]
+    
+    return ProdutoPaginaResponse(itens=resultado, next_cursor=pagina["proximo_cursor"])
 
 # ✅ ENDPOINT: Detalhes de um produto
 @router.get("/produtos/{produto_id}", response_model=ProdutoResponse)
-def detalhe_produto_mobile(produto_id: int, db: Session = Depends(get_db)):
+def detalhe_produto_mobile(produto_id: int, db: Session = Depends(get_db_leitura)):
     """Retorna detalhes de um produto em JSON"""
-    produto = db.query(Produto).filter(Produto.id == produto_id).first()
+    produto = obter_produto(db, produto_id)
     
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     
-    return ProdutoResponse(
-        id=produto.id,
-        nome=produto.nome,
-        preco=float(produto.preco),
-        descricao=produto.descricao,
-        imagem=f"/static/uploads/{produto.imagem}" if produto.imagem else None,
-        cor=produto.cor,
-        tamanho=produto.tamanho,
-        categoria_id=produto.categoria_id,
-        categoria_nome=produto.categoria.nome if produto.categoria else None
-    )
+    return _produto_response(produto)
 
 # ✅ ENDPOINT: Listar categorias
 @router.get("/categorias", response_model=List[CategoriaResponse])
-def listar_categorias_mobile(db: Session = Depends(get_db)):
+def listar_categorias_mobile(db: Session = Depends(get_db_leitura)):
     """Retorna lista de categorias em JSON"""
     categorias = db.query(Categoria).all()
     return [CategoriaResponse(id=c.id, nome=c.nome) for c in categorias]
 
 # ✅ ENDPOINT: Login (retorna JSON)
 @router.post("/login", response_model=LoginResponse)
-def login_mobile(
+async def login_mobile(
     dados: LoginRequest,
     db: Session = Depends(get_db)
 ):
-    """Login que retorna token em JSON (não usa cookie)"""
-    from auth import verificar_senha, criar_token
+    """
+    Login que retorna token em JSON (não usa cookie).
+    async: o hash de senha é esperado com await; o banco vai para o threadpool.
+    """
+    from auth import verificar_e_atualizar_senha, criar_token, ServicoSenhasOcupado
+    from auth_deps import regravar_hash_senha
+    
+    usuario = await run_in_threadpool(db.query(Usuario).filter(Usuario.email == dados.email).first)
     
-    usuario = db.query(Usuario).filter(Usuario.email == dados.email).first()
+    senha_confere, novo_hash = False, None
+    if usuario:
+        try:
+            senha_confere, novo_hash = await verificar_e_atualizar_senha(dados.senha, usuario.senha)
+        except ServicoSenhasOcupado:
+            raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente em instantes")
     
-    if not usuario or not verificar_senha(dados.senha, usuario.senha):
+    if not senha_confere:
         return LoginResponse(
             success=False,
             message="Credenciais inválidas"
         )
     
+    # Regrava o hash se os parâmetros do argon2 mudaram
+    if novo_hash:
+        await run_in_threadpool(regravar_hash_senha, db, usuario, novo_hash)
+    
     # Criar token JWT
     token = criar_token({"sub": usuario.email})
     
@@ -158,20 +170,14 @@ def get_carrinho(
     if not usuario:
         return {"itens": [], "total": 0, "autenticado": False}
     
-    from models import Pedido, ItemPedido
-    
-    pedido = db.query(Pedido).filter(
-        Pedido.usuario_id == usuario.id,
-        Pedido.status == "Em andamento"
-    ).first()
+    pedido = carregar_carrinho(db, usuario.id)
     
     itens = []
     total = 0
     
     if pedido:
-        itens_db = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-        for item in itens_db:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
+        for item in pedido.itens:
+            produto = item.produto
             if produto:
                 itens.append({
                     "id": item.id,
@@ -211,17 +217,17 @@ def adicionar_carrinho(
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     
-    # Busca ou cria pedido em andamento
+    # Busca ou cria pedido em andamento (linha travada até o commit)
     pedido = db.query(Pedido).filter(
         Pedido.usuario_id == usuario.id,
         Pedido.status == "Em andamento"
-    ).first()
+    ).with_for_update().first()
     
     if not pedido:
-        pedido = Pedido(usuario_id=usuario.id, status="Em andamento", valor_total=0)
+        pedido = Pedido(usuario_id=usuario.id, status="Em andamento", valor_total=0, total_itens=0)
         db.add(pedido)
-        db.commit()
-        db.refresh(pedido)
+        db.flush()  # gera o id sem fechar a transação
+        registrar_pedido_novo(db, pedido)
     
     # Verifica se item já existe
     item = db.query(ItemPedido).filter(
@@ -229,11 +235,15 @@ def adicionar_carrinho(
         ItemPedido.produto_id == produto_id
     ).first()
     
+    # Verifica estoque (descontando o que está reservado em outros carrinhos)
+    disponivel = estoque_disponivel(db, produto.id, pedido.id)
+    if disponivel < quantidade + (item.quantidade if item else 0):
+        raise HTTPException(status_code=400, detail=f"Estoque insuficiente. Disponível: {disponivel}")
+    
     subtotal = float(produto.preco) * quantidade
     
     if item:
-        item.quantidade += quantidade
-        item.subtotal += subtotal
+        aplicar_delta_item(item, quantidade, subtotal)
     else:
         item = ItemPedido(
             pedido_id=pedido.id,
@@ -242,11 +252,13 @@ def adicionar_carrinho(
             subtotal=subtotal
         )
         db.add(item)
+        db.flush()  # gera o id do item para a reserva
+    
+    # Reserva (ou renova) as unidades deste item no carrinho
+    reservar_item(db, item)
     
-    # Atualiza total do pedido
-    itens = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-    total = sum(float(i.subtotal) for i in itens)
-    pedido.valor_total = total
+    # Atualiza total do pedido pela diferença (um único commit)
+    aplicar_delta_carrinho(pedido, subtotal, quantidade)
     
     db.commit()
     
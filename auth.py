@@ -1,20 +1,115 @@
 # auth.py
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
+from cache import CacheLRU, AUSENTE
 
 SECRET_KEY = "chave-secreta"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Custo do argon2 (padrões = os do passlib). Ao mudar, os hashes antigos
+# continuam válidos e são refeitos no próximo login (verificar_e_atualizar_senha).
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
 
-# Hash de senha
-def gerar_hash_senha(senha: str):
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM
+)
+
+# =========================
+# POOL DE PROCESSOS PARA HASH DE SENHA
+# =========================
+# O argon2 é caro de propósito. Ele roda num pool de processos separado e
+# as rotas esperam o resultado com await: nem o event loop nem uma thread
+# do threadpool ficam presos durante o hash. No máximo SENHA_FILA_MAXIMA
+# operações ficam pendentes; passando disso a chamada desiste na hora com
+# ServicoSenhasOcupado (a rota responde 503).
+SENHA_PROCESSOS = int(os.getenv("SENHA_PROCESSOS", "2"))
+SENHA_FILA_MAXIMA = int(os.getenv("SENHA_FILA_MAXIMA", "64"))
+
+class ServicoSenhasOcupado(Exception):
+    """Fila do pool de senhas cheia (SENHA_FILA_MAXIMA operações pendentes)"""
+
+_pool_senhas = None
+_lock_pool = threading.Lock()
+_pendentes = 0  # enviadas ao pool e ainda não concluídas
+_rejeitadas = 0
+
+def _obter_pool():
+    global _pool_senhas
+    with _lock_pool:
+        if _pool_senhas is None:
+            # spawn: o processo filho não herda as threads/conexões do worker web
+            _pool_senhas = ProcessPoolExecutor(
+                max_workers=SENHA_PROCESSOS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool_senhas
+
+def encerrar_pool_senhas():
+    """Chamado no shutdown do app"""
+    global _pool_senhas
+    with _lock_pool:
+        if _pool_senhas is not None:
+            _pool_senhas.shutdown(wait=False, cancel_futures=True)
+            _pool_senhas = None
+
+async def _executar_no_pool(funcao, *args):
+    global _pendentes, _rejeitadas
+    with _lock_pool:
+        if _pendentes >= SENHA_FILA_MAXIMA:
+            _rejeitadas += 1
+            raise ServicoSenhasOcupado("Muitas operações de senha em andamento, tente novamente")
+        _pendentes += 1
+    try:
+        return await asyncio.wrap_future(_obter_pool().submit(funcao, *args))
+    finally:
+        with _lock_pool:
+            _pendentes -= 1
+
+def estatisticas_senhas() -> dict:
+    with _lock_pool:
+        return {
+            "processos": SENHA_PROCESSOS,
+            "pendentes": _pendentes,
+            "na_fila": max(0, _pendentes - SENHA_PROCESSOS),
+            "fila_maxima": SENHA_FILA_MAXIMA,
+            "rejeitadas": _rejeitadas
+        }
+
+# Executadas dentro do processo do pool
+def _hash_senha(senha: str):
     return pwd_context.hash(senha)
 
-def verificar_senha(senha: str, senha_hash: str):
-    return pwd_context.verify(senha, senha_hash)
+def _verificar_e_atualizar(senha: str, senha_hash: str):
+    return pwd_context.verify_and_update(senha, senha_hash)
+
+# Hash de senha (usar com await)
+async def gerar_hash_senha(senha: str):
+    return await _executar_no_pool(_hash_senha, senha)
+
+async def verificar_senha(senha: str, senha_hash: str):
+    return (await verificar_e_atualizar_senha(senha, senha_hash))[0]
+
+async def verificar_e_atualizar_senha(senha: str, senha_hash: str):
+    """
+    (senha_confere, novo_hash). novo_hash só vem preenchido quando o hash
+    guardado usa parâmetros antigos do argon2 e deve ser regravado.
+    """
+    return await _executar_no_pool(_verificar_e_atualizar, senha, senha_hash)
 
 # Criar token JWT
 def criar_token(dados: dict):
@@ -24,8 +119,31 @@ def criar_token(dados: dict):
     token_jwt = jwt.encode(dados_token, SECRET_KEY, algorithm=ALGORITHM)
     return token_jwt
 
+# Cache de tokens já verificados: o mesmo cookie chega em toda requisição
+# durante os 30 minutos de vida do token. Chave = sha256 do token (o token
+# em si não fica guardado); cada entrada expira junto com o 'exp' do token.
+cache_tokens = CacheLRU(max_itens=int(os.getenv("TOKEN_CACHE_MAX_ITENS", "10000")))
+
+def _digest_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
 # Verificar token JWT
 def verificar_token(token: str):
+    chave = _digest_token(token)
+    payload = cache_tokens.buscar(chave)
+    if payload is not AUSENTE:
+        return dict(payload)
+
+    payload = decodificar_token(token)
+    if payload:
+        restante = payload.get("exp", 0) - time.time()
+        if restante > 0:
+            cache_tokens.guardar(chave, payload, ttl=restante)
+        return dict(payload)
+    return None
+
+def decodificar_token(token: str):
+    """Verificação completa (assinatura + exp), sem cache"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -1,16 +1,68 @@
 
+import os
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 from database import get_db
 from models import Usuario
 from auth import verificar_token
+from cache import CacheLRU, AUSENTE
+
+# =========================
+# CACHE DO USUÁRIO AUTENTICADO
+# =========================
+# Dentro da requisição: o usuário fica em request.state (as dependências e
+# chamadas repetidas não vão de novo ao banco).
+# Entre requisições: cópia desanexada do Usuario por 'sub' (email) com TTL
+# curto, religada à sessão da requisição com merge(load=False), sem SELECT.
+USUARIO_CACHE_TTL = float(os.getenv("USUARIO_CACHE_TTL", "60"))
+
+cache_usuarios = CacheLRU(
+    max_itens=int(os.getenv("USUARIO_CACHE_MAX_ITENS", "5000")),
+    ttl=USUARIO_CACHE_TTL,
+    escopo="usuarios"
+)
+
+def invalidar_usuarios():
+    """Chamar depois de alterar dados de um usuário (o canal invalida o escopo todo, em todos os workers)"""
+    cache_usuarios.invalidar()
+
+def regravar_hash_senha(db: Session, usuario: Usuario, novo_hash: str):
+    """Hash feito com parâmetros antigos do argon2: regrava com os atuais"""
+    usuario.senha = novo_hash
+    db.commit()
+    invalidar_usuarios()
+
+def _copia_desanexada(usuario: Usuario) -> Usuario:
+    """Cópia só com as colunas, sem vínculo com nenhuma sessão"""
+    colunas = {coluna.key: getattr(usuario, coluna.key) for coluna in inspect(Usuario).column_attrs}
+    copia = Usuario(**colunas)
+    make_transient_to_detached(copia)
+    return copia
+
+def _buscar_usuario(db: Session, email: str):
+    copia = cache_usuarios.buscar(email)
+    if copia is not AUSENTE:
+        return db.merge(copia, load=False)
+
+    usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    if usuario:
+        cache_usuarios.guardar(email, _copia_desanexada(usuario))
+    return usuario
 
 def get_usuario_atual(request: Request, db: Session = Depends(get_db)):
     """
     Dependency para obter o usuário atual baseado no token JWT
     Retorna None se não estiver autenticado (em vez de erro)
     """
+    usuario = getattr(request.state, "usuario_atual", AUSENTE)
+    if usuario is AUSENTE:
+        usuario = _resolver_usuario(request, db)
+        request.state.usuario_atual = usuario
+    return usuario
+
+def _resolver_usuario(request: Request, db: Session):
     token = request.cookies.get("token")
     
     if not token:
@@ -25,8 +77,7 @@ def get_usuario_atual(request: Request, db: Session = Depends(get_db)):
         if not email:
             return None
         
-        usuario = db.query(Usuario).filter(Usuario.email == email).first()
-        return usuario
+        return _buscar_usuario(db, email)
     
     except Exception as e:
         print(f"Erro na autenticação: {e}")
@@ -1,21 +1,14 @@
 from sqlalchemy import create_engine, Column, Integer, String, DECIMAL, Text, ForeignKey, TIMESTAMP, func
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from urllib.parse import quote_plus
 import random
+from database import DATABASE_URL, DB_ECHO
 
 # =========================
 # CONEXÃO COM O BANCO
 # =========================
+# Mesmas credenciais do app (variáveis DB_*); SQL no console só com DB_ECHO=true
 
-usuario = "root"
-senha = quote_plus("dev1t@24")  # Codifica o @ corretamente
-host = "localhost"
-porta = "3306"
-banco = "banco"  # altere se o nome for diferente
-
-DATABASE_URL = f"mysql+mysqlconnector://{usuario}:{senha}@{host}:{porta}/{banco}"
-
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, echo=DB_ECHO)
 Base = declarative_base()
 
 # =========================
@@ -0,0 +1,55 @@
+# benchmark_concorrencia.py
+# Teste de carga simples: dispara requisições simultâneas contra o servidor
+# em execução e mostra quantas requisições por segundo ele atende com
+# 1, 10 e 50 clientes ao mesmo tempo. Se as rotas travassem o event loop,
+# as req/s ficariam iguais em todos os níveis.
+#
+# Uso: python benchmark_concorrencia.py [url_base] [caminho] [requisicoes_por_nivel]
+#      python benchmark_concorrencia.py http://localhost:8000 / 500
+import asyncio
+import sys
+import time
+import httpx
+
+NIVEIS_CONCORRENCIA = [1, 10, 50]
+
+async def _disparar(cliente: httpx.AsyncClient, caminho: str, total: int, concorrencia: int):
+    limite = asyncio.Semaphore(concorrencia)
+    tempos = []
+    erros = 0
+
+    async def uma_requisicao():
+        nonlocal erros
+        async with limite:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.get(caminho)
+                if resposta.status_code >= 500:
+                    erros += 1
+            except httpx.HTTPError:
+                erros += 1
+            tempos.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma_requisicao() for _ in range(total)))
+    duracao = time.perf_counter() - inicio
+
+    tempos.sort()
+    p95 = tempos[int(len(tempos) * 0.95) - 1] * 1000
+    return total / duracao, p95, erros
+
+async def benchmark_concorrencia(url_base: str, caminho: str, total: int):
+    print(f"🔄 {total} requisições GET {url_base}{caminho} por nível de concorrência")
+    limites = httpx.Limits(max_connections=max(NIVEIS_CONCORRENCIA))
+    async with httpx.AsyncClient(base_url=url_base, limits=limites, timeout=30) as cliente:
+        await cliente.get(caminho)  # aquecimento (caches, pool de conexões)
+        for concorrencia in NIVEIS_CONCORRENCIA:
+            req_s, p95, erros = await _disparar(cliente, caminho, total, concorrencia)
+            print(f"📊 {concorrencia:>3} simultâneas: {req_s:8.1f} req/s | p95 {p95:7.1f} ms | erros {erros}")
+    print("✅ Teste de carga concluído")
+
+if __name__ == "__main__":
+    url_base = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    caminho = sys.argv[2] if len(sys.argv) > 2 else "/"
+    total = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    asyncio.run(benchmark_concorrencia(url_base, caminho, total))
@@ -0,0 +1,135 @@
+# benchmark_estoque.py
+# Teste de concorrência da baixa de estoque: cria um produto com pouco
+# estoque e dispara centenas de POST /checkout/finalizar simultâneos contra
+# o servidor em execução, cada um comprando 1 unidade. No fim confere no
+# banco que não houve venda a mais:
+#   - o estoque do produto não ficou negativo
+#   - unidades baixadas == unidades nos pedidos criados == checkouts aceitos
+#   - aceitos <= estoque inicial
+# Sai com código 1 se alguma conferência falhar.
+#
+# Uso: python benchmark_estoque.py [url_base] [checkouts] [estoque]
+#      python benchmark_estoque.py http://localhost:8000 300 5
+#      (prepara e confere os dados no mesmo banco do app, variáveis DB_*,
+#       e apaga tudo o que criou no final)
+import asyncio
+import sys
+import time
+import uuid
+import httpx
+from sqlalchemy import func
+from database import SessionLocal
+from models import (
+    Usuario, Produto, Pedido, ItemPedido, ReservaEstoque,
+    EstatisticasUsuario, EventoOutbox
+)
+
+def _preparar(estoque: int):
+    """Cria o comprador e o produto do teste; retorna (usuario_id, produto_id)"""
+    sufixo = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        usuario = Usuario(nome="Teste de estoque", email=f"estoque-{sufixo}@teste.local", senha="-")
+        produto = Produto(nome=f"Teste de estoque {sufixo}", preco=10.0, quantidade=estoque, descricao="")
+        db.add_all([usuario, produto])
+        db.commit()
+        return usuario.id, produto.id
+    finally:
+        db.close()
+
+async def _disparar(url_base: str, usuario_id: int, produto_id: int, total: int):
+    """Todos os checkouts ao mesmo tempo; retorna {status_code: quantidade}"""
+    corpo = {
+        "usuario_id": usuario_id,
+        "endereco_entrega": "Teste de concorrência",
+        "itens": [{"produto_id": produto_id, "quantidade": 1}]
+    }
+    respostas = {}
+    inicio = asyncio.Event()
+
+    async def um_checkout(cliente: httpx.AsyncClient):
+        await inicio.wait()
+        try:
+            resposta = await cliente.post("/checkout/finalizar", json=corpo)
+            codigo = resposta.status_code
+        except httpx.HTTPError as e:
+            codigo = type(e).__name__
+        respostas[codigo] = respostas.get(codigo, 0) + 1
+
+    limites = httpx.Limits(max_connections=total)
+    async with httpx.AsyncClient(base_url=url_base, limits=limites, timeout=60) as cliente:
+        tarefas = [asyncio.ensure_future(um_checkout(cliente)) for _ in range(total)]
+        await asyncio.sleep(0)
+        inicio.set()  # solta todos juntos
+        await asyncio.gather(*tarefas)
+    return respostas
+
+def _conferir(usuario_id: int, produto_id: int):
+    """(estoque final, unidades nos pedidos do teste, pedidos do teste)"""
+    db = SessionLocal()
+    try:
+        estoque_final = db.query(Produto.quantidade).filter(Produto.id == produto_id).scalar()
+        vendidas = db.query(func.coalesce(func.sum(ItemPedido.quantidade), 0)).join(
+            Pedido, Pedido.id == ItemPedido.pedido_id
+        ).filter(Pedido.usuario_id == usuario_id, ItemPedido.produto_id == produto_id).scalar()
+        pedidos = db.query(func.count(Pedido.id)).filter(Pedido.usuario_id == usuario_id).scalar()
+        return int(estoque_final), int(vendidas), int(pedidos)
+    finally:
+        db.close()
+
+def _limpar(usuario_id: int, produto_id: int):
+    db = SessionLocal()
+    try:
+        pedido_ids = db.query(Pedido.id).filter(Pedido.usuario_id == usuario_id).scalar_subquery()
+        for modelo in (EventoOutbox, ReservaEstoque, ItemPedido):
+            db.query(modelo).filter(modelo.pedido_id.in_(pedido_ids)).delete(synchronize_session=False)
+        db.query(Pedido).filter(Pedido.usuario_id == usuario_id).delete(synchronize_session=False)
+        db.query(EstatisticasUsuario).filter(EstatisticasUsuario.usuario_id == usuario_id).delete(synchronize_session=False)
+        db.query(Produto).filter(Produto.id == produto_id).delete(synchronize_session=False)
+        db.query(Usuario).filter(Usuario.id == usuario_id).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Erro ao apagar os dados do teste (usuário {usuario_id}, produto {produto_id}): {e}")
+    finally:
+        db.close()
+
+def benchmark_estoque(url_base: str, total: int = 300, estoque: int = 5) -> bool:
+    usuario_id, produto_id = _preparar(estoque)
+    print(f"🔄 {total} checkouts simultâneos de 1 unidade do produto {produto_id} (estoque {estoque})")
+    try:
+        inicio = time.perf_counter()
+        respostas = asyncio.run(_disparar(url_base, usuario_id, produto_id, total))
+        duracao = time.perf_counter() - inicio
+
+        estoque_final, vendidas, pedidos = _conferir(usuario_id, produto_id)
+        aceitos = respostas.get(200, 0)
+        baixadas = estoque - estoque_final
+        print(f"📊 {duracao:.1f}s | respostas {dict(sorted(respostas.items(), key=str))}")
+        print(f"📊 estoque {estoque} -> {estoque_final} | unidades em pedidos {vendidas} | pedidos {pedidos}")
+
+        falhas = []
+        if estoque_final < 0:
+            falhas.append(f"estoque negativo ({estoque_final})")
+        if aceitos > estoque:
+            falhas.append(f"{aceitos} checkouts aceitos com estoque {estoque}")
+        if vendidas != baixadas:
+            falhas.append(f"{vendidas} unidades em pedidos, mas {baixadas} baixadas do estoque")
+        if aceitos != vendidas:
+            falhas.append(f"{aceitos} checkouts aceitos, mas {vendidas} unidades em pedidos")
+
+        for falha in falhas:
+            print(f"❌ Venda a mais: {falha}")
+        if not falhas:
+            if baixadas < min(estoque, total):
+                print(f"⚠️ Sem venda a mais, mas sobraram {estoque_final} unidades (veja os erros acima)")
+            print("✅ Nenhuma unidade vendida a mais")
+        return not falhas
+    finally:
+        _limpar(usuario_id, produto_id)
+
+if __name__ == "__main__":
+    url_base = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    estoque = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    sys.exit(0 if benchmark_estoque(url_base, total, estoque) else 1)
@@ -0,0 +1,27 @@
+# benchmark_jwt.py
+# Compara o custo de verificar o mesmo token JWT repetidas vezes:
+# decodificação completa (jose) x cache de tokens verificados.
+# Uso: python benchmark_jwt.py [repeticoes]
+import sys
+import timeit
+from auth import criar_token, verificar_token, decodificar_token, cache_tokens
+
+def benchmark_jwt(repeticoes: int = 20000):
+    token = criar_token({"sub": "benchmark@loja.com"})
+
+    print(f"🔄 Verificando o mesmo token {repeticoes} vezes...")
+
+    sem_cache = timeit.timeit(lambda: decodificar_token(token), number=repeticoes)
+
+    cache_tokens.invalidar()
+    com_cache = timeit.timeit(lambda: verificar_token(token), number=repeticoes)
+
+    por_chamada_sem = sem_cache / repeticoes * 1e6
+    por_chamada_com = com_cache / repeticoes * 1e6
+
+    print(f"🔐 Sem cache: {sem_cache:.3f}s ({por_chamada_sem:.1f} µs por verificação)")
+    print(f"⚡ Com cache: {com_cache:.3f}s ({por_chamada_com:.1f} µs por verificação)")
+    print(f"✅ {por_chamada_sem / por_chamada_com:.1f}x mais rápido | {cache_tokens.estatisticas()}")
+
+if __name__ == "__main__":
+    benchmark_jwt(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
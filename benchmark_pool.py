@@ -0,0 +1,62 @@
+# benchmark_pool.py
+# Mede o esgotamento do pool de conexões: N threads (como o threadpool do
+# FastAPI num pico) pegam uma conexão, seguram por alguns milissegundos
+# (uma consulta) e devolvem. Para cada configuração de pool mostra vazão,
+# espera por conexão e quantas vezes estourou o DB_POOL_TIMEOUT.
+#
+# Uso: python benchmark_pool.py [url_do_banco] [threads] [consultas_por_thread]
+#      (sem URL usa a mesma configuração do app, variáveis DB_*)
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text, exc
+from database import DATABASE_URL, PoolMonitorado
+
+# (pool_size, max_overflow)
+CONFIGURACOES = [(5, 10), (10, 20), (20, 20), (40, 10)]
+SEGURAR_MS = 20     # tempo com a conexão em mãos (simula a consulta)
+POOL_TIMEOUT = 2    # curto de propósito, para o esgotamento aparecer
+
+def _rodar(url: str, pool_size: int, max_overflow: int, threads: int, consultas: int):
+    engine = create_engine(
+        url,
+        poolclass=PoolMonitorado,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=POOL_TIMEOUT
+    )
+
+    def trabalho(_):
+        for _ in range(consultas):
+            try:
+                with engine.connect() as conexao:
+                    conexao.execute(text("SELECT 1"))
+                    time.sleep(SEGURAR_MS / 1000)
+            except exc.TimeoutError:
+                pass  # contado em esgotamentos
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(trabalho, range(threads)))
+    duracao = time.perf_counter() - inicio
+
+    metricas = engine.pool.metricas()
+    engine.dispose()
+    return threads * consultas / duracao, metricas
+
+def benchmark_pool(url: str, threads: int = 50, consultas: int = 20):
+    print(f"🔄 {threads} threads x {consultas} consultas, {SEGURAR_MS} ms com a conexão em mãos")
+    for pool_size, max_overflow in CONFIGURACOES:
+        vazao, m = _rodar(url, pool_size, max_overflow, threads, consultas)
+        print(
+            f"📊 pool {pool_size:>2} + overflow {max_overflow:>2}: {vazao:7.1f} consultas/s | "
+            f"espera média {m['espera_media_ms']:7.1f} ms | máxima {m['espera_maxima_ms']:7.1f} ms | "
+            f"esgotamentos {m['esgotamentos']}"
+        )
+    print("✅ Ajuste DB_POOL_SIZE + DB_MAX_OVERFLOW para a espera média ficar perto de zero no pico")
+
+if __name__ == "__main__":
+    url = sys.argv[1] if len(sys.argv) > 1 else DATABASE_URL
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    consultas = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    benchmark_pool(url, threads, consultas)
@@ -0,0 +1,120 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+from invalidacao import canal, INTERVALO_VERIFICACAO
+
+# Marca "chave não encontrada" (None é um valor válido para guardar)
+AUSENTE = object()
+
+class CacheLRU:
+    """
+    Cache em memória, com limite de itens (remove o menos usado - LRU)
+    e TTL opcional em segundos.
+
+    Cada invalidar() incrementa a versão e descarta tudo. Um valor que
+    começou a ser carregado antes da invalidação não é gravado, para o
+    cache não ser repovoado com dado velho.
+
+    Com 'escopo', invalidar() também é publicado no canal de invalidação
+    (invalidacao.py) e as invalidações feitas por outros workers são
+    aplicadas aqui antes de cada leitura.
+    """
+
+    def __init__(self, max_itens: int = 1000, ttl: float = None, escopo: str = None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.escopo = escopo
+        self.versao = 0
+        self.acertos = 0
+        self.falhas = 0
+        self._dados = OrderedDict()  # chave -> (valor, expira_em)
+        self._lock = threading.Lock()
+        self._versao_canal = AUSENTE  # a primeira leitura consulta o canal
+        self._verificado_em = 0.0
+
+    def _sincronizar(self):
+        """Descarta o conteúdo local se outro worker publicou uma invalidação"""
+        agora = time.monotonic()
+        if agora - self._verificado_em < INTERVALO_VERIFICACAO:
+            return
+        self._verificado_em = agora
+        try:
+            versao_canal = canal.versao(self.escopo)
+        except Exception as e:
+            # Canal fora do ar: melhor não servir cache possivelmente velho
+            print(f"Erro ao consultar canal de invalidação: {e}")
+            versao_canal = object()
+        with self._lock:
+            if versao_canal != self._versao_canal:
+                self._versao_canal = versao_canal
+                self.versao += 1
+                self._dados.clear()
+
+    def buscar(self, chave):
+        """Retorna o valor guardado ou AUSENTE"""
+        if self.escopo:
+            self._sincronizar()
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is not None:
+                valor, expira_em = entrada
+                if expira_em is None or expira_em > time.monotonic():
+                    self._dados.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._dados[chave]
+            self.falhas += 1
+            return AUSENTE
+
+    def guardar(self, chave, valor, ttl: float = None, versao: int = None):
+        """Guarda um valor; se 'versao' for informada e o cache já foi invalidado depois dela, descarta"""
+        ttl = ttl if ttl is not None else self.ttl
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if versao is not None and versao != self.versao:
+                return
+            self._dados[chave] = (valor, expira_em)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+
+    def obter(self, chave, carregar, ttl: float = None):
+        """Retorna o valor do cache ou chama carregar() e guarda o resultado"""
+        valor = self.buscar(chave)
+        if valor is not AUSENTE:
+            return valor
+        versao = self.versao
+        valor = carregar()
+        self.guardar(chave, valor, ttl=ttl, versao=versao)
+        return valor
+
+    def remover(self, chave):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def invalidar(self):
+        """Descarta todo o conteúdo, avança a versão e avisa os outros workers"""
+        versao_canal = None
+        if self.escopo:
+            try:
+                versao_canal = canal.publicar(self.escopo)
+            except Exception as e:
+                print(f"Erro ao publicar invalidação de '{self.escopo}': {e}")
+        with self._lock:
+            self.versao += 1
+            self._dados.clear()
+            if versao_canal is not None:
+                self._versao_canal = versao_canal
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "itens": len(self._dados),
+                "max_itens": self.max_itens,
+                "versao": self.versao,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0
+            }
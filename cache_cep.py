@@ -0,0 +1,100 @@
+# cache_cep.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from cache import CacheLRU, AUSENTE
+
+# =========================
+# CACHE DE CONSULTAS DE CEP (ViaCEP)
+# =========================
+# CEP -> endereço praticamente não muda, então cada CEP só vai ao ViaCEP
+# uma vez por CEP_CACHE_TTL. CEPs inexistentes ("erro" no ViaCEP) também
+# são guardados (cache negativo), com TTL menor.
+#
+# Camada 1: memória (LRU + TTL), por processo.
+# Camada 2 (opcional): SQLite em CEP_CACHE_SQLITE, sobrevive a reinícios
+#                      e é compartilhada entre os workers da máquina.
+
+CEP_CACHE_TTL = int(os.getenv("CEP_CACHE_TTL", str(30 * 24 * 3600)))       # 30 dias
+CEP_CACHE_TTL_ERRO = int(os.getenv("CEP_CACHE_TTL_ERRO", str(24 * 3600)))  # 1 dia
+CEP_CACHE_MAX_ITENS = int(os.getenv("CEP_CACHE_MAX_ITENS", "10000"))
+CEP_CACHE_SQLITE = os.getenv("CEP_CACHE_SQLITE", "")
+
+class CacheCEP:
+    def __init__(self, max_itens: int, ttl: int, ttl_erro: int, caminho_sqlite: str = ""):
+        self.memoria = CacheLRU(max_itens=max_itens, ttl=ttl)
+        self.ttl = ttl
+        self.ttl_erro = ttl_erro
+        self.caminho_sqlite = caminho_sqlite
+        self.acertos_sqlite = 0
+        self._lock = threading.Lock()
+        if caminho_sqlite:
+            with self._conectar() as conexao:
+                conexao.execute(
+                    "CREATE TABLE IF NOT EXISTS cep_cache ("
+                    " cep TEXT PRIMARY KEY, dados TEXT NOT NULL, expira_em REAL NOT NULL)"
+                )
+
+    def _conectar(self):
+        return sqlite3.connect(self.caminho_sqlite, timeout=5)
+
+    def _ler_sqlite(self, cep: str):
+        try:
+            with self._conectar() as conexao:
+                return conexao.execute(
+                    "SELECT dados, expira_em FROM cep_cache WHERE cep = ?", (cep,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Erro ao ler cache de CEP: {e}")
+            return None
+
+    def _gravar_sqlite(self, cep: str, dados: dict, ttl: float):
+        try:
+            with self._conectar() as conexao:
+                conexao.execute(
+                    "INSERT OR REPLACE INTO cep_cache (cep, dados, expira_em) VALUES (?, ?, ?)",
+                    (cep, json.dumps(dados), time.time() + ttl)
+                )
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar cache de CEP: {e}")
+
+    # A camada SQLite é I/O bloqueante (e pode esperar até 5s pela trava do
+    # arquivo), então roda em asyncio.to_thread, fora do event loop
+    async def buscar(self, cep: str):
+        """Dados do ViaCEP guardados para o CEP (dict, com 'erro' se não existe) ou AUSENTE"""
+        dados = self.memoria.buscar(cep)
+        if dados is not AUSENTE or not self.caminho_sqlite:
+            return dados
+
+        linha = await asyncio.to_thread(self._ler_sqlite, cep)
+        if not linha or linha[1] <= time.time():
+            return AUSENTE
+
+        dados = json.loads(linha[0])
+        with self._lock:
+            self.acertos_sqlite += 1
+        # Sobe para a memória pelo tempo que ainda resta
+        self.memoria.guardar(cep, dados, ttl=linha[1] - time.time())
+        return dados
+
+    async def guardar(self, cep: str, dados: dict):
+        ttl = self.ttl_erro if "erro" in dados else self.ttl
+        self.memoria.guardar(cep, dados, ttl=ttl)
+        if self.caminho_sqlite:
+            await asyncio.to_thread(self._gravar_sqlite, cep, dados, ttl)
+
+    def estatisticas(self) -> dict:
+        dados = self.memoria.estatisticas()
+        dados["acertos_sqlite"] = self.acertos_sqlite
+        dados["sqlite"] = bool(self.caminho_sqlite)
+        return dados
+
+cache_cep = CacheCEP(
+    max_itens=CEP_CACHE_MAX_ITENS,
+    ttl=CEP_CACHE_TTL,
+    ttl_erro=CEP_CACHE_TTL_ERRO,
+    caminho_sqlite=CEP_CACHE_SQLITE
+)
@@ -0,0 +1,179 @@
+# catalogo.py
+import os
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from models import Produto, Categoria, VariacaoProduto
+from cache import CacheLRU
+from database import sessao_em_replica
+
+# =========================
+# PAGINAÇÃO DO CATÁLOGO
+# =========================
+PAGINA_PADRAO = int(os.getenv("CATALOGO_PAGINA_PADRAO", "24"))
+PAGINA_MAXIMA = int(os.getenv("CATALOGO_PAGINA_MAXIMA", "100"))
+
+def listar_pagina_produtos(
+    db: Session,
+    cursor: Optional[int] = None,
+    limite: int = PAGINA_PADRAO,
+    categoria_id: Optional[int] = None
+):
+    """
+    Paginação por cursor (keyset em Produto.id).
+    Retorna (produtos, proximo_cursor); proximo_cursor é None na última página.
+    Busca limite + 1 linhas para saber se existe próxima página sem COUNT(*).
+    """
+    query = db.query(Produto).options(joinedload(Produto.categoria))
+
+    if categoria_id:
+        query = query.filter(Produto.categoria_id == categoria_id)
+
+    if cursor:
+        query = query.filter(Produto.id > cursor)
+
+    produtos = query.order_by(Produto.id).limit(limite + 1).all()
+
+    proximo_cursor = None
+    if len(produtos) > limite:
+        produtos = produtos[:limite]
+        proximo_cursor = produtos[-1].id
+
+    return produtos, proximo_cursor
+
+def indice_cores_por_categoria(db: Session):
+    """
+    Monta {categoria_id: {cor: quantidade_de_produtos}} com UMA consulta agrupada
+    """
+    linhas = db.query(
+        Produto.categoria_id, Produto.cor, func.count(Produto.id)
+    ).filter(
+        Produto.categoria_id.isnot(None),
+        Produto.cor.isnot(None)
+    ).group_by(Produto.categoria_id, Produto.cor).all()
+
+    indice = {}
+    for categoria_id, cor, total in linhas:
+        if cor:
+            indice.setdefault(categoria_id, {})[cor] = total
+    return indice
+
+# =========================
+# CACHE DE LEITURA DO CATÁLOGO
+# =========================
+# O catálogo só muda pelas rotas de admin, que chamam invalidar_catalogo().
+# As leituras guardam "fotografias" em dict (nunca objetos ORM, que ficam
+# presos à sessão que os carregou). A quantidade em estoque NÃO entra nas
+# fotografias: ela muda a cada checkout e cancelamento, e quem precisa dela
+# lê direto do banco (estoque.py), então essas rotas não invalidam o cache.
+# O escopo "catalogo" propaga a invalidação para os outros workers.
+cache_catalogo = CacheLRU(
+    max_itens=int(os.getenv("CATALOGO_CACHE_MAX_ITENS", "512")),
+    escopo="catalogo"
+)
+
+# O que foi lido de uma réplica pode estar um pouco atrasado em relação a
+# uma escrita recém-invalidada, então só fica no cache por pouco tempo.
+CATALOGO_TTL_REPLICA = float(os.getenv("CATALOGO_TTL_REPLICA", "30"))
+
+def invalidar_catalogo():
+    """Chamar depois de qualquer commit que altere produtos, categorias ou variações"""
+    cache_catalogo.invalidar()
+
+def _ttl(db: Session):
+    return CATALOGO_TTL_REPLICA if sessao_em_replica(db) else None
+
+def categoria_para_dict(categoria):
+    if not categoria:
+        return None
+    return {"id": categoria.id, "nome": categoria.nome}
+
+def produto_para_dict(produto):
+    """Fotografia do produto, sem a quantidade em estoque (ver acima)"""
+    return {
+        "id": produto.id,
+        "nome": produto.nome,
+        "preco": float(produto.preco),
+        "imagem": produto.imagem,
+        "tamanho": produto.tamanho,
+        "cor": produto.cor,
+        "descricao": produto.descricao,
+        "categoria_id": produto.categoria_id,
+        "categoria": categoria_para_dict(produto.categoria)
+    }
+
+def obter_pagina_produtos(
+    db: Session,
+    cursor: Optional[int] = None,
+    limite: int = PAGINA_PADRAO,
+    categoria_id: Optional[int] = None
+):
+    """Versão em cache de listar_pagina_produtos: {'produtos': [dict], 'proximo_cursor': int|None}"""
+    def carregar():
+        produtos, proximo_cursor = listar_pagina_produtos(db, cursor, limite, categoria_id)
+        return {
+            "produtos": [produto_para_dict(p) for p in produtos],
+            "proximo_cursor": proximo_cursor
+        }
+    return cache_catalogo.obter(("pagina", cursor, limite, categoria_id), carregar, ttl=_ttl(db))
+
+def obter_indice_cores(db: Session):
+    return cache_catalogo.obter(("indice_cores",), lambda: indice_cores_por_categoria(db), ttl=_ttl(db))
+
+def obter_categorias(db: Session):
+    return cache_catalogo.obter(
+        ("categorias",),
+        lambda: [categoria_para_dict(c) for c in db.query(Categoria).all()],
+        ttl=_ttl(db)
+    )
+
+def obter_produto(db: Session, produto_id: int):
+    """Produto em dict ou None se não existir"""
+    def carregar():
+        produto = db.query(Produto).options(
+            joinedload(Produto.categoria)
+        ).filter(Produto.id == produto_id).first()
+        return produto_para_dict(produto) if produto else None
+    return cache_catalogo.obter(("produto", produto_id), carregar, ttl=_ttl(db))
+
+def obter_cores_tamanhos_categoria(db: Session, categoria_id: int):
+    """(cores, tamanhos) distintos dos produtos de uma categoria"""
+    def carregar():
+        linhas = db.query(Produto.cor, Produto.tamanho).filter(
+            Produto.categoria_id == categoria_id
+        ).distinct().all()
+        cores = list({cor for cor, _ in linhas if cor})
+        tamanhos = list({tamanho for _, tamanho in linhas if tamanho})
+        return cores, tamanhos
+    return cache_catalogo.obter(("cores_tamanhos", categoria_id), carregar, ttl=_ttl(db))
+
+def obter_produtos_categoria(db: Session, categoria_id: int):
+    """{'categoria': dict|None, 'produtos': [dict]}"""
+    def carregar():
+        categoria = db.query(Categoria).filter(Categoria.id == categoria_id).first()
+        produtos = db.query(Produto).options(
+            joinedload(Produto.categoria)
+        ).filter(Produto.categoria_id == categoria_id).all()
+        return {
+            "categoria": categoria_para_dict(categoria),
+            "produtos": [produto_para_dict(p) for p in produtos]
+        }
+    return cache_catalogo.obter(("categoria", categoria_id), carregar, ttl=_ttl(db))
+
+def obter_variacoes(db: Session, produto_id: int):
+    def carregar():
+        variacoes = db.query(VariacaoProduto).options(
+            joinedload(VariacaoProduto.produto)
+        ).filter(VariacaoProduto.produto_id == produto_id).all()
+        return [
+            {
+                "id": v.id,
+                "cor": v.cor,
+                "tamanho": v.tamanho,
+                "quantidade": v.quantidade,
+                "imagem": v.imagem,
+                "preco": v.produto.preco  # Preço do produto principal
+            }
+            for v in variacoes
+        ]
+    return cache_catalogo.obter(("variacoes", produto_id), carregar, ttl=_ttl(db))
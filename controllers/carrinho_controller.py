@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Form, Header
 from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, marcar_leitura_no_primario
 from auth_deps import get_usuario_atual
 from models import Usuario, Produto, Pedido, ItemPedido
+from pedidos import carregar_carrinho, aplicar_delta_carrinho, aplicar_delta_item, registrar_pedido_novo, registrar_mudanca_status
+from estoque import (
+    baixar_estoque, somar_quantidades, estoque_disponivel,
+    reservar_item, liberar_reserva_item, liberar_reservas_pedido
+)
+from idempotencia import CABECALHO, reservar_chave, guardar_resposta, impressao_requisicao
+from outbox import registrar_evento
 from fastapi.templating import Jinja2Templates
+from typing import Optional
 
 router = APIRouter(prefix="/api/carrinho", tags=["Carrinho"])
 templates = Jinja2Templates(directory="templates")
 
 # Rota para visualizar o carrinho (HTML)
 @router.get("/", response_class=HTMLResponse)
-async def ver_carrinho(
+def ver_carrinho(
     request: Request, 
     usuario: Usuario = Depends(get_usuario_atual),
     db: Session = Depends(get_db)
@@ -22,18 +31,14 @@ async def ver_carrinho(
     if not usuario:
         return RedirectResponse(url="/login", status_code=303)
 
-    pedido = db.query(Pedido).filter(
-        Pedido.usuario_id == usuario.id, 
-        Pedido.status == "Em andamento"
-    ).first()
+    pedido = carregar_carrinho(db, usuario.id)
 
     itens_carrinho = []
     total_geral = 0.0
 
     if pedido:
-        itens = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-        for item in itens:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
+        for item in pedido.itens:
+            produto = item.produto
             if produto:
                 itens_carrinho.append({
                     "id": item.id,
@@ -61,6 +66,7 @@ async def adicionar_ao_carrinho(
     request: Request,
     produto_id: int = Form(None),
     quantidade: int = Form(1),
+    usuario: Usuario = Depends(get_usuario_atual),
     db: Session = Depends(get_db)
 ):
     """
@@ -76,7 +82,10 @@ async def adicionar_ao_carrinho(
         except Exception:
             raise HTTPException(status_code=400, detail="Dados inválidos")
 
-    usuario = get_usuario_atual(request, db)
+    # O resto usa a sessão síncrona do banco: roda no threadpool para não travar o event loop
+    return await run_in_threadpool(_adicionar_item, db, usuario, produto_id, quantidade)
+
+def _adicionar_item(db: Session, usuario: Usuario, produto_id: int, quantidade: int) -> JSONResponse:
     if not usuario:
         raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
@@ -91,28 +100,31 @@ async def adicionar_ao_carrinho(
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
 
-    # Verifica estoque
-    if produto.quantidade < quantidade:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Estoque insuficiente. Disponível: {produto.quantidade}"
-        )
-
-    # Busca ou cria pedido em andamento
+    # Busca pedido em andamento, travando a linha: adições simultâneas ao
+    # mesmo carrinho passam uma de cada vez pela checagem de estoque
     pedido = db.query(Pedido).filter(
         Pedido.usuario_id == usuario.id, 
         Pedido.status == "Em andamento"
-    ).first()
+    ).with_for_update().first()
+
+    # Verifica estoque (descontando o que está reservado em outros carrinhos)
+    disponivel = estoque_disponivel(db, produto.id, pedido.id if pedido else None)
+    if disponivel < quantidade:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Estoque insuficiente. Disponível: {disponivel}"
+        )
     
     if not pedido:
         pedido = Pedido(
             usuario_id=usuario.id, 
             status="Em andamento", 
-            valor_total=0.00
+            valor_total=0.00,
+            total_itens=0
         )
         db.add(pedido)
-        db.commit()
-        db.refresh(pedido)
+        db.flush()  # gera o id sem fechar a transação
+        registrar_pedido_novo(db, pedido)
 
     # Busca item existente ou cria novo
     item = db.query(ItemPedido).filter(
@@ -126,14 +138,13 @@ async def adicionar_ao_carrinho(
         nova_quantidade = item.quantidade + int(quantidade)
         
         # Verifica estoque novamente com a quantidade total
-        if produto.quantidade < nova_quantidade:
+        if disponivel < nova_quantidade:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Estoque insuficiente para adicionar mais itens. Disponível: {produto.quantidade}"
+                detail=f"Estoque insuficiente para adicionar mais itens. Disponível: {disponivel}"
             )
             
-        item.quantidade = nova_quantidade
-        item.subtotal = float(item.subtotal) + subtotal
+        aplicar_delta_item(item, int(quantidade), subtotal)
     else:
         item = ItemPedido(
             pedido_id=pedido.id,
@@ -142,21 +153,22 @@ async def adicionar_ao_carrinho(
             subtotal=subtotal
         )
         db.add(item)
+        db.flush()  # gera o id do item para a reserva
 
-    db.commit()
+    # Reserva (ou renova) as unidades deste item no carrinho
+    reservar_item(db, item)
 
-    # Atualiza valor total do pedido
-    itens_pedido = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-    total = sum(float(it.subtotal) for it in itens_pedido)
-    pedido.valor_total = total
+    # Atualiza o total do pedido pela diferença (um único commit)
+    aplicar_delta_carrinho(pedido, subtotal, int(quantidade))
     db.commit()
 
-    return JSONResponse({
+    # Próximas leituras deste usuário vão ao primário (a réplica pode não ter o item ainda)
+    return marcar_leitura_no_primario(JSONResponse({
         "mensagem": "Item adicionado ao carrinho com sucesso",
         "pedido_id": pedido.id,
         "valor_total": float(pedido.valor_total),
-        "quantidade_total": sum(it.quantidade for it in itens_pedido)
-    })
+        "quantidade_total": pedido.total_itens
+    }))
 
 
 @router.post("/finalizar")
@@ -165,11 +177,14 @@ async def finalizar_pedido(
     endereco: str = Form(None),
     frete: float = Form(0.00),  # ✅ NOVO: parâmetro para frete
     cep_entrega: str = Form(None),  # ✅ NOVO: CEP de entrega
+    chave_idempotencia: Optional[str] = Header(None, alias=CABECALHO),
+    usuario: Usuario = Depends(get_usuario_atual),
     db: Session = Depends(get_db)
 ):
     """
     Finaliza o pedido atual do usuário logado.
-    Aceita tanto Form quanto JSON.
+    Aceita tanto Form quanto JSON. Com o cabeçalho Idempotency-Key, uma
+    retentativa recebe a resposta da primeira execução.
     """
     # Caso venha como JSON
     if endereco is None:
@@ -183,94 +198,129 @@ async def finalizar_pedido(
             frete = 0.00
             cep_entrega = ""
 
-    usuario = get_usuario_atual(request, db)
+    return await run_in_threadpool(
+        _finalizar_carrinho, db, usuario, endereco, frete, cep_entrega, chave_idempotencia
+    )
+
+def _finalizar_carrinho(
+    db: Session,
+    usuario: Usuario,
+    endereco: str,
+    frete: float,
+    cep_entrega: str,
+    chave_idempotencia: str = None
+) -> JSONResponse:
     if not usuario:
         raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
-    pedido = db.query(Pedido).filter(
-        Pedido.usuario_id == usuario.id, 
+    registro_chave = None
+    if chave_idempotencia:
+        repetida, registro_chave = reservar_chave(
+            db, chave_idempotencia, f"carrinho/finalizar:{usuario.id}",
+            impressao_requisicao({"endereco": endereco, "frete": frete, "cep_entrega": cep_entrega})
+        )
+        if repetida:
+            return marcar_leitura_no_primario(repetida)
+
+    # Trava o carrinho antes de ler os itens: uma remoção ou adição
+    # simultânea termina antes (ou espera este checkout terminar)
+    db.query(Pedido.id).filter(
+        Pedido.usuario_id == usuario.id,
         Pedido.status == "Em andamento"
-    ).first()
+    ).with_for_update().first()
+    pedido = carregar_carrinho(db, usuario.id)
     
     if not pedido:
         raise HTTPException(status_code=404, detail="Nenhum pedido em andamento")
 
     # Verifica se há itens no carrinho
-    itens = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-    if not itens:
+    if not pedido.itens:
         raise HTTPException(status_code=400, detail="Carrinho vazio")
 
-    # Atualiza estoque dos produtos
-    for item in itens:
-        produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-        if produto:
-            if produto.quantidade < item.quantidade:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Estoque insuficiente para {produto.nome}"
-                )
-            produto.quantidade -= item.quantidade
+    # Baixa o estoque de todos os produtos de uma vez (checagem atômica no banco)
+    sem_estoque = baixar_estoque(
+        db,
+        somar_quantidades((item.produto_id, item.quantidade) for item in pedido.itens),
+        pedido_id=pedido.id
+    )
+    if sem_estoque:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Estoque insuficiente para {', '.join(sem_estoque)}"
+        )
 
     # ✅ ATUALIZA O PEDIDO COM FRETE E CEP
     pedido.endereco_entrega = endereco
     pedido.valor_frete = frete  # ✅ SALVA O VALOR DO FRETE
     pedido.cep_entrega = cep_entrega  # ✅ SALVA O CEP
+    status_anterior = pedido.status
     pedido.status = "Finalizado"
-    db.commit()
+    # O frete passa a contar no total gasto (os produtos já contam desde o carrinho)
+    registrar_mudanca_status(db, pedido, status_anterior, delta_gasto=float(frete or 0))
+    liberar_reservas_pedido(db, pedido.id)  # o estoque já foi baixado
+    # Trabalho pós-pedido vai para o outbox, confirmado junto com o pedido
+    registrar_evento(db, "pedido_finalizado", pedido, {
+        "valor_total": float(pedido.valor_total),
+        "valor_frete": float(frete or 0)
+    })
 
-    return JSONResponse({
+    resposta = {
         "mensagem": "Pedido finalizado com sucesso",
         "pedido_id": pedido.id,
         "valor_total": float(pedido.valor_total),
         "valor_frete": float(frete)  # ✅ RETORNA O FRETE NA RESPOSTA
-    })
+    }
+    if registro_chave:
+        guardar_resposta(registro_chave, resposta)  # confirmada junto com o pedido
+    db.commit()
+
+    return marcar_leitura_no_primario(JSONResponse(resposta))
 
 
 @router.post("/remover/{item_id}")
-async def remover_do_carrinho(
+def remover_do_carrinho(
     request: Request,
     item_id: int,
+    usuario: Usuario = Depends(get_usuario_atual),
     db: Session = Depends(get_db)
 ):
     """
     Remove um item do carrinho
     """
-    usuario = get_usuario_atual(request, db)
     if not usuario:
         raise HTTPException(status_code=401, detail="Usuário não autenticado")
 
+    # Trava o carrinho antes de ler o item, como na adição: se um checkout
+    # está confirmando, a remoção espera e depois já não acha o carrinho
+    # 'Em andamento' (não mexe no pedido finalizado nem no estoque baixado)
+    pedido = db.query(Pedido).filter(
+        Pedido.usuario_id == usuario.id,
+        Pedido.status == "Em andamento"
+    ).with_for_update().first()
+
     item = db.query(ItemPedido).filter(ItemPedido.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item não encontrado")
 
     # Verifica se o item pertence ao pedido do usuário
-    pedido = db.query(Pedido).filter(
-        Pedido.id == item.pedido_id,
-        Pedido.usuario_id == usuario.id,
-        Pedido.status == "Em andamento"
-    ).first()
-    
-    if not pedido:
+    if not pedido or item.pedido_id != pedido.id:
         raise HTTPException(status_code=403, detail="Item não pertence ao seu carrinho")
 
+    # Atualiza o total do pedido pela diferença (um único commit)
+    aplicar_delta_carrinho(pedido, -float(item.subtotal), -item.quantidade)
+    liberar_reserva_item(db, item.id)
     db.delete(item)
     db.commit()
 
-    # Atualiza valor total do pedido
-    itens_restantes = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-    total = sum(float(it.subtotal) for it in itens_restantes)
-    pedido.valor_total = total
-    db.commit()
-
-    return JSONResponse({
+    return marcar_leitura_no_primario(JSONResponse({
         "mensagem": "Item removido do carrinho",
         "valor_total": float(pedido.valor_total)
-    })
+    }))
 
 
 # Rota para obter dados do carrinho via API (usada pelo JavaScript)
 @router.get("/dados")
-async def obter_dados_carrinho(
+def obter_dados_carrinho(
     request: Request,
     usuario: Usuario = Depends(get_usuario_atual),
     db: Session = Depends(get_db)
@@ -286,19 +336,15 @@ async def obter_dados_carrinho(
             "autenticado": False
         })
 
-    pedido = db.query(Pedido).filter(
-        Pedido.usuario_id == usuario.id, 
-        Pedido.status == "Em andamento"
-    ).first()
+    pedido = carregar_carrinho(db, usuario.id)
 
     itens_carrinho = []
     total_geral = 0
     total_itens = 0
 
     if pedido:
-        itens = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-        for item in itens:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
+        for item in pedido.itens:
+            produto = item.produto
             if produto:
                 itens_carrinho.append({
                     "id": item.id,
@@ -5,6 +5,7 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Categoria
+from catalogo import invalidar_catalogo
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -32,6 +33,7 @@ def criar_categoria(
     nova_categoria = Categoria(nome=nome)
     db.add(nova_categoria)
     db.commit()
+    invalidar_catalogo()
     
     return RedirectResponse(url="/novo", status_code=303)
 
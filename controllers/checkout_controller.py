@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response, Header
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from decimal import Decimal
+from datetime import date
 import models
 from database import get_db
+from pedidos import registrar_pedido_novo, carregar_historico, carregar_itens_pedidos
+from estoque import baixar_estoque, somar_quantidades
+from idempotencia import CABECALHO, reservar_chave, guardar_resposta, impressao_requisicao
+from outbox import registrar_evento
 
 router = APIRouter(prefix="/checkout", tags=["Checkout e Pedidos"])
 
@@ -19,7 +25,7 @@ class IdentificacaoRequest(BaseModel):
 
 class CarrinhoItem(BaseModel):
     produto_id: int
-    quantidade: int
+    quantidade: int = Field(..., gt=0)
 
 class CheckoutRequest(BaseModel):
     usuario_id: int
@@ -69,56 +75,92 @@ def identificacao_usuario(dados: IdentificacaoRequest, db: Session = Depends(get
 # ROTA 2 - FINALIZAR CHECKOUT
 # ============================================================
 @router.post("/finalizar", response_model=PedidoResponse)
-def finalizar_pedido(dados: CheckoutRequest, db: Session = Depends(get_db)):
-    """Cria o pedido real no banco com os itens do carrinho."""
-    usuario = db.query(models.Usuario).get(dados.usuario_id)
+def finalizar_pedido(
+    dados: CheckoutRequest,
+    chave_idempotencia: Optional[str] = Header(None, alias=CABECALHO),
+    db: Session = Depends(get_db)
+):
+    """
+    Cria o pedido real no banco com os itens do carrinho.
+    Poucas idas ao banco qualquer que seja o tamanho do carrinho: produtos
+    num único IN, baixa de estoque num único UPDATE e itens num único INSERT.
+    Com o cabeçalho Idempotency-Key, uma retentativa recebe o mesmo pedido
+    em vez de criar outro.
+    """
+    usuario = db.get(models.Usuario, dados.usuario_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     if not dados.itens:
         raise HTTPException(status_code=400, detail="Carrinho vazio")
 
-    # Cria o pedido no banco
+    registro_chave = None
+    if chave_idempotencia:
+        repetida, registro_chave = reservar_chave(
+            db, chave_idempotencia, f"checkout/finalizar:{usuario.id}",
+            impressao_requisicao(dados.model_dump())
+        )
+        if repetida:
+            return repetida
+
+    # Todos os produtos do carrinho numa consulta
+    quantidades = somar_quantidades((item.produto_id, item.quantidade) for item in dados.itens)
+    produtos = {
+        produto.id: produto
+        for produto in db.query(models.Produto).filter(models.Produto.id.in_(quantidades)).all()
+    }
+    for produto_id in quantidades:
+        if produto_id not in produtos:
+            raise HTTPException(status_code=404, detail=f"Produto {produto_id} não encontrado")
+
+    # Cria o pedido no banco (o estoque é baixado aqui, então já não é um carrinho)
     novo_pedido = models.Pedido(
         usuario_id=usuario.id,
         endereco_entrega=dados.endereco_entrega,
-        status="Em andamento",
+        status="Processando",
         valor_total=Decimal("0.00")
     )
     db.add(novo_pedido)
     db.flush()
 
+    # Checagem e baixa de estoque de todos os produtos num UPDATE atômico
+    sem_estoque = baixar_estoque(db, quantidades)
+    if sem_estoque:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Estoque insuficiente para {', '.join(sem_estoque)}"
+        )
+
     total = Decimal("0.00")
+    linhas_itens = []
     itens_resposta = []
-
     for item in dados.itens:
-        produto = db.query(models.Produto).get(item.produto_id)
-        if not produto:
-            db.rollback()
-            raise HTTPException(status_code=404, detail=f"Produto {item.produto_id} não encontrado")
-
+        produto = produtos[item.produto_id]
         subtotal = Decimal(str(produto.preco)) * item.quantidade
         total += subtotal
 
-        novo_item = models.ItemPedido(
-            pedido_id=novo_pedido.id,
-            produto_id=produto.id,
-            quantidade=item.quantidade,
-            subtotal=subtotal
-        )
-        db.add(novo_item)
-
+        linhas_itens.append({
+            "pedido_id": novo_pedido.id,
+            "produto_id": produto.id,
+            "quantidade": item.quantidade,
+            "subtotal": subtotal
+        })
         itens_resposta.append(ItemPedidoResponse(
             produto=produto.nome,
             quantidade=item.quantidade,
             subtotal=subtotal
         ))
 
+    # Todos os itens num único INSERT (executemany)
+    db.execute(insert(models.ItemPedido), linhas_itens)
+
     novo_pedido.valor_total = total
-    db.commit()
-    db.refresh(novo_pedido)
+    novo_pedido.total_itens = sum(quantidades.values())
+    registrar_pedido_novo(db, novo_pedido)
+    # Trabalho pós-pedido vai para o outbox, confirmado junto com o pedido
+    registrar_evento(db, "pedido_finalizado", novo_pedido, {"valor_total": float(total), "valor_frete": 0.0})
 
-    return PedidoResponse(
+    resposta = PedidoResponse(
         id=novo_pedido.id,
         data_pedido=str(novo_pedido.data_pedido),
         status=novo_pedido.status,
@@ -126,26 +168,51 @@ def finalizar_pedido(dados: CheckoutRequest, db: Session = Depends(get_db)):
         endereco_entrega=novo_pedido.endereco_entrega,
         itens=itens_resposta
     )
+    if registro_chave:
+        guardar_resposta(registro_chave, resposta.model_dump(mode="json"))  # confirmada junto com o pedido
+    db.commit()
+
+    return resposta
 
 # ============================================================
 # ROTA 3 - HISTÓRICO DE PEDIDOS
 # ============================================================
 @router.get("/historico/{usuario_id}", response_model=List[PedidoResponse])
-def historico_pedidos(usuario_id: int, db: Session = Depends(get_db)):
-    """Retorna o histórico de pedidos de um usuário."""
-    pedidos = db.query(models.Pedido).filter(models.Pedido.usuario_id == usuario_id).all()
-    if not pedidos:
+def historico_pedidos(
+    usuario_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    de: Optional[date] = None,
+    ate: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Retorna o histórico de pedidos de um usuário (mais recentes primeiro).
+    Paginado por cursor: o cabeçalho X-Proximo-Cursor traz o valor para pedir
+    a próxima página (ausente na última). 'de'/'ate' filtram pela data.
+    """
+    try:
+        linhas, proximo_cursor = carregar_historico(db, usuario_id, cursor, de, ate)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    if not linhas and not cursor:
         raise HTTPException(status_code=404, detail="Nenhum pedido encontrado para este usuário")
+    if proximo_cursor:
+        response.headers["X-Proximo-Cursor"] = proximo_cursor
+
+    # Itens de todos os pedidos da página, com o nome do produto, numa consulta
+    itens_por_pedido = carregar_itens_pedidos(db, [linha.Pedido.id for linha in linhas])
 
     resposta = []
-    for pedido in pedidos:
+    for linha in linhas:
+        pedido = linha.Pedido
         itens_resposta = [
             ItemPedidoResponse(
-                produto=db.query(models.Produto).get(item.produto_id).nome if item.produto_id else "Produto removido",
+                produto=nome or "Produto removido",
                 quantidade=item.quantidade,
                 subtotal=item.subtotal
             )
-            for item in pedido.itens
+            for item, nome in itens_por_pedido[pedido.id]
         ]
         resposta.append(PedidoResponse(
             id=pedido.id,
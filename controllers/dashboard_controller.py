@@ -1,12 +1,16 @@
 # dashboard_controller.py
-from fastapi import APIRouter, Request, Depends, HTTPException, Form
+from fastapi import APIRouter, Request, Depends, HTTPException, Form, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from database import get_db
-from auth_deps import get_usuario_atual, login_required
+from database import get_db, get_db_leitura, marcar_leitura_no_primario
+from auth_deps import get_usuario_atual, login_required, invalidar_usuarios
 from models import Usuario, Pedido, ItemPedido, Produto
-from datetime import datetime
+from pedidos import STATUS_CARRINHO, obter_estatisticas, carregar_pagina_pedidos, carregar_historico, registrar_mudanca_status, PEDIDOS_POR_PAGINA
+from estoque import devolver_estoque, somar_quantidades, liberar_reservas_pedido
+from outbox import registrar_evento
+from datetime import datetime, date
+from typing import Optional
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -15,32 +19,31 @@ templates = Jinja2Templates(directory="templates")
 # DASHBOARD DO USUÁRIO
 # =========================
 @router.get("/dashboard", response_class=HTMLResponse)
-async def dashboard_usuario(
+def dashboard_usuario(
     request: Request,
+    pagina: int = Query(1, ge=1),
     usuario: Usuario = Depends(login_required),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
-    Página principal do dashboard do usuário
+    Página principal do dashboard do usuário.
+    Estatísticas: a linha materializada do usuário. Cards: uma página de pedidos com
+    itens e produtos carregados numa única consulta.
     """
-    # Buscar pedidos do usuário
-    pedidos = db.query(Pedido).filter(
-        Pedido.usuario_id == usuario.id
-    ).order_by(Pedido.data_pedido.desc()).all()
+    estatisticas = obter_estatisticas(db, usuario.id)
+    pedidos = carregar_pagina_pedidos(db, usuario.id, pagina)
     
     # Formatar dados dos pedidos
     pedidos_formatados = []
     for pedido in pedidos:
-        itens_pedido = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-        
         # ✅ CALCULAR VALOR CORRETO (produtos + frete)
         valor_frete = float(pedido.valor_frete) if pedido.valor_frete else 0.00
         valor_total_correto = float(pedido.valor_total) + valor_frete
         
-        # Buscar detalhes dos produtos
+        # Detalhes dos produtos (já carregados junto com o pedido)
         itens_detalhados = []
-        for item in itens_pedido:
-            produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
+        for item in pedido.itens:
+            produto = item.produto
             if produto:
                 itens_detalhados.append({
                     'nome': produto.nome,
@@ -62,36 +65,26 @@ async def dashboard_usuario(
             'itens': itens_detalhados
         })
     
-    # ✅ CORREÇÃO: Calcular estatísticas incluindo o frete
-    total_pedidos = len(pedidos)
-    pedidos_ativos = len([p for p in pedidos if p.status in ['Em andamento', 'Processando']])
-    
-    # ✅ CALCULAR TOTAL GASTO INCLUINDO FRETE
-    total_gasto = 0
-    for pedido in pedidos:
-        valor_frete = float(pedido.valor_frete) if pedido.valor_frete else 0.00
-        total_gasto += float(pedido.valor_total) + valor_frete
+    total_paginas = max(1, -(-estatisticas["total_pedidos"] // PEDIDOS_POR_PAGINA))
     
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "usuario": usuario,
         "pedidos": pedidos_formatados,
-        "estatisticas": {
-            "total_pedidos": total_pedidos,
-            "pedidos_ativos": pedidos_ativos,
-            "total_gasto": total_gasto  # ✅ AGORA COM FRETE
-        }
+        "estatisticas": estatisticas,
+        "pagina": pagina,
+        "total_paginas": total_paginas
     })
 
 # =========================
 # DETALHES DO PEDIDO
 # =========================
 @router.get("/dashboard/pedido/{pedido_id}", response_class=HTMLResponse)
-async def detalhes_pedido(
+def detalhes_pedido(
     request: Request,
     pedido_id: int,
     usuario: Usuario = Depends(login_required),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
     Página de detalhes de um pedido específico
@@ -140,21 +133,22 @@ async def detalhes_pedido(
 # PERFIL DO USUÁRIO
 # =========================
 @router.get("/dashboard/perfil", response_class=HTMLResponse)
-async def perfil_usuario(
+def perfil_usuario(
     request: Request,
     usuario: Usuario = Depends(login_required),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
-    Página de perfil do usuário
+    Página de perfil do usuário (com o resumo de pedidos da linha materializada)
     """
     return templates.TemplateResponse("perfil_usuario.html", {
         "request": request,
-        "usuario": usuario
+        "usuario": usuario,
+        "estatisticas": obter_estatisticas(db, usuario.id)
     })
 
 @router.post("/dashboard/perfil/atualizar")
-async def atualizar_perfil(
+def atualizar_perfil(
     request: Request,
     nome: str = Form(...),
     telefone: str = Form(...),
@@ -167,6 +161,7 @@ async def atualizar_perfil(
     usuario.nome = nome
     usuario.telefone = telefone
     db.commit()
+    invalidar_usuarios()  # nome/telefone em cache ficaram velhos
     
     return RedirectResponse("/dashboard/perfil?sucesso=true", status_code=303)
 
@@ -174,95 +169,99 @@ async def atualizar_perfil(
 # HISTÓRICO DE PEDIDOS
 # =========================
 @router.get("/dashboard/pedidos", response_class=HTMLResponse)
-async def historico_pedidos(
+def historico_pedidos(
     request: Request,
+    cursor: Optional[str] = None,
+    de: Optional[str] = None,
+    ate: Optional[str] = None,
     usuario: Usuario = Depends(login_required),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
-    Página com histórico completo de pedidos
+    Página com histórico completo de pedidos, paginado por cursor e filtrável
+    por período. Cada página é UMA consulta agrupada (pedido + itens + produtos).
     """
-    pedidos = db.query(Pedido).filter(
-        Pedido.usuario_id == usuario.id
-    ).order_by(Pedido.data_pedido.desc()).all()
+    # O formulário de filtro envia os campos de data vazios como ""
+    try:
+        de = date.fromisoformat(de) if de else None
+        ate = date.fromisoformat(ate) if ate else None
+        linhas, proximo_cursor = carregar_historico(db, usuario.id, cursor or None, de, ate)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Filtro de data ou cursor de paginação inválido")
     
     pedidos_formatados = []
-    for pedido in pedidos:
-        itens_count = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).count()
-        
+    for linha in linhas:
+        pedido = linha.Pedido
         pedidos_formatados.append({
             'id': pedido.id,
             'data_pedido': pedido.data_pedido.strftime('%d/%m/%Y'),
             'status': pedido.status,
             'valor_total': float(pedido.valor_total),
-            'quantidade_itens': itens_count
+            'quantidade_itens': linha.quantidade_itens,
+            'produtos': linha.produtos or ''
         })
     
     return templates.TemplateResponse("historico_pedidos.html", {
         "request": request,
         "usuario": usuario,
-        "pedidos": pedidos_formatados
+        "pedidos": pedidos_formatados,
+        "proximo_cursor": proximo_cursor,
+        "de": de,
+        "ate": ate
     })
 
 # =========================
 # CANCELAR PEDIDO
 # =========================
 @router.post("/dashboard/pedido/{pedido_id}/cancelar")
-async def cancelar_pedido(
+def cancelar_pedido(
     pedido_id: int,
     usuario: Usuario = Depends(login_required),
     db: Session = Depends(get_db)
 ):
     """
-    Cancela um pedido (apenas se estiver em andamento)
+    Cancela um pedido (apenas se estiver em andamento ou processando)
     """
+    # Linha travada: dois cancelamentos simultâneos não devolvem o estoque duas vezes
     pedido = db.query(Pedido).filter(
         Pedido.id == pedido_id,
         Pedido.usuario_id == usuario.id,
-        Pedido.status.in_(['Em andamento', 'Processando'])
-    ).first()
+        Pedido.status.in_([STATUS_CARRINHO, 'Processando'])
+    ).with_for_update().first()
     
     if not pedido:
         raise HTTPException(status_code=404, detail="Pedido não encontrado ou não pode ser cancelado")
     
-    # Restaurar estoque dos produtos
-    itens_pedido = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
-    for item in itens_pedido:
-        produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-        if produto:
-            produto.quantidade += item.quantidade
+    # Só devolve estoque de pedido que já deu baixa nele; o carrinho só
+    # tem reservas, que são liberadas abaixo
+    if pedido.status != STATUS_CARRINHO:
+        itens_pedido = db.query(ItemPedido).filter(ItemPedido.pedido_id == pedido.id).all()
+        devolver_estoque(db, somar_quantidades((item.produto_id, item.quantidade) for item in itens_pedido))
     
     # Cancelar pedido
+    liberar_reservas_pedido(db, pedido.id)
+    status_anterior = pedido.status
     pedido.status = "Cancelado"
+    registrar_mudanca_status(db, pedido, status_anterior)
+    registrar_evento(db, "pedido_cancelado", pedido, {"status_anterior": status_anterior})
     db.commit()
     
-    return RedirectResponse("/dashboard/pedidos?cancelado=true", status_code=303)
+    # O histórico (lido da réplica) precisa mostrar o cancelamento em seguida
+    return marcar_leitura_no_primario(RedirectResponse("/dashboard/pedidos?cancelado=true", status_code=303))
 
-@router.get("/perfil", response_class=HTMLResponse)
-async def perfil_usuario(
-    request: Request,
-    usuario: Usuario = Depends(login_required),
-    db: Session = Depends(get_db)
-):
+@router.get("/perfil")
+def perfil_redirecionar(usuario: Usuario = Depends(login_required)):
     """
-    Página do perfil do usuário
+    Endereço antigo do perfil: a página fica em /dashboard/perfil
     """
-    return templates.TemplateResponse("perfil.html", {
-        "request": request,
-        "usuario": usuario,
-        "estatisticas": {
-            "total_pedidos": 0,  # Você pode calcular essas estatísticas
-            "pedidos_ativos": 0,
-            "total_gasto": 0.0
-        }
-    })
+    return RedirectResponse("/dashboard/perfil", status_code=303)
 
 # ✅ NOVA ROTA: API para detalhes do pedido
 @router.get("/api/pedidos/{pedido_id}")
-async def api_detalhes_pedido(
+def api_detalhes_pedido(
     pedido_id: int,
     usuario: Usuario = Depends(login_required),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
     API para obter detalhes de um pedido específico
@@ -1,10 +1,18 @@
 # frete_controller.py
+import asyncio
+import json
+import os
+from typing import List, Optional
 from fastapi import APIRouter, Request, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-import requests
 from database import get_db
 from auth_deps import get_usuario_atual
 from models import Usuario
+from cache_cep import cache_cep
+from viacep import consultar_cep, ViaCEPIndisponivel, disjuntor
+from faixas_cep import tabela_faixas_cep
 
 router = APIRouter()
 
@@ -49,53 +57,120 @@ TABELA_FRETES = {
     }
 }
 
+# REGRAS POR CARRINHO (COTAÇÃO EM LOTE) - OPCIONAIS, DESLIGADAS POR PADRÃO
+# Até PESO_INCLUSO_KG vale a tabela; acima disso soma FRETE_ADICIONAL_POR_KG
+# por kg. Carrinho a partir de FRETE_GRATIS_ACIMA tem frete grátis.
+# Com os dois em 0 (padrão) o carrinho não altera a cotação: cada loja
+# liga a sua política pelas variáveis de ambiente.
+FRETE_PESO_INCLUSO_KG = float(os.getenv("FRETE_PESO_INCLUSO_KG", "1"))
+FRETE_ADICIONAL_POR_KG = float(os.getenv("FRETE_ADICIONAL_POR_KG", "0"))
+FRETE_GRATIS_ACIMA = float(os.getenv("FRETE_GRATIS_ACIMA", "0"))
+
+# COTAÇÃO EM LOTE
+FRETE_LOTE_MAXIMO = int(os.getenv("FRETE_LOTE_MAXIMO", "5000"))
+FRETE_LOTE_CONCORRENCIA = int(os.getenv("FRETE_LOTE_CONCORRENCIA", "10"))
+
+class CarrinhoFrete(BaseModel):
+    valor_total: float = 0
+    peso_kg: float = 0
+
+class CotacaoFreteItem(BaseModel):
+    cep: str
+    carrinho: Optional[CarrinhoFrete] = None
+
+class LoteFreteRequest(BaseModel):
+    itens: List[CotacaoFreteItem]
+    com_endereco: bool = False
+
 @router.get("/api/frete")
-def calcular_frete(
+async def calcular_frete(
     request: Request,
     cep_destino: str = Query(...),
+    com_endereco: bool = Query(True),
     usuario: Usuario = Depends(get_usuario_atual),
     db: Session = Depends(get_db)
 ):
     """
-    Calcula o frete baseado no CEP de destino usando regras realistas
+    Calcula o frete baseado no CEP de destino usando regras realistas.
+    O preço sai da tabela offline de faixas de CEP; o ViaCEP só é consultado
+    para o texto do endereço (com_endereco) ou para CEPs fora da tabela.
     """
     # Verifica se usuário está autenticado
     if not usuario:
         raise HTTPException(status_code=401, detail="Usuário não autenticado")
     
+    return await cotar_cep(cep_destino, com_endereco)
+
+async def cotar_cep(cep_destino: str, com_endereco: bool = True) -> dict:
+    """
+    Frete de um CEP (sem considerar o carrinho).
+    Levanta HTTPException 400 se o CEP for inválido ou não existir.
+    """
     # Validação simples de CEP
     if not cep_destino.isdigit() or len(cep_destino) != 8:
         raise HTTPException(status_code=400, detail="CEP inválido")
     
-    # Consulta no ViaCEP
-    via_cep_url = f"https://viacep.com.br/ws/{cep_destino}/json/"
+    # Localização (UF/cidade) sem rede, pela faixa do CEP
+    localizacao = tabela_faixas_cep.localizar(cep_destino)
     
-    try:
-        resposta = requests.get(via_cep_url, timeout=10)
-        resposta.raise_for_status()
-        
-        dados = resposta.json()
+    dados = None
+    if com_endereco or not localizacao:
+        try:
+            # Consulta no ViaCEP (cache + cliente assíncrono compartilhado)
+            dados = await consultar_cep(cep_destino)
+        except ViaCEPIndisponivel:
+            if not localizacao:
+                # ViaCEP fora do ar e CEP fora da tabela: estimativa pela região
+                return estimar_frete_por_regiao(cep_destino)
         
-        if "erro" in dados:
+        if dados and "erro" in dados:
             raise HTTPException(status_code=400, detail="CEP não encontrado")
-        
-        # CALCULA FRETE BASEADO NA LOCALIZAÇÃO REAL
-        valor_frete, prazo_estimado = calcular_frete_por_localizacao(dados)
-        
-        # Retorno dados estruturados
-        return {
-            "endereco": f"{dados.get('logradouro', '')}, {dados.get('bairro', '')}, {dados.get('localidade', '')} - {dados.get('uf', '')}",
-            "cep": cep_destino,
-            "valor_frete": valor_frete,
-            "prazo_estimado_dias": prazo_estimado,
-            "cidade": dados.get('localidade', ''),
-            "estado": dados.get('uf', ''),
-            "regiao": encontrar_regiao_por_estado(dados.get('uf', '')),
-            "status": "cálculo concluído"
-        }
-        
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=400, detail=f"Erro ao consultar o CEP: {str(e)}")
+    
+    if not localizacao:
+        localizacao = {"uf": dados.get('uf', ''), "localidade": dados.get('localidade', '')}
+    
+    # CALCULA FRETE BASEADO NA LOCALIZAÇÃO REAL
+    valor_frete, prazo_estimado = calcular_frete_por_localizacao(localizacao)
+    
+    cidade = dados.get('localidade', '') if dados else localizacao["localidade"]
+    estado = localizacao["uf"]
+    
+    # Retorno dados estruturados
+    return {
+        "endereco": f"{dados.get('logradouro', '')}, {dados.get('bairro', '')}, {cidade} - {estado}" if dados else "",
+        "cep": cep_destino,
+        "valor_frete": valor_frete,
+        "prazo_estimado_dias": prazo_estimado,
+        "cidade": cidade,
+        "estado": estado,
+        "regiao": encontrar_regiao_por_estado(estado),
+        "status": "cálculo concluído"
+    }
+
+# PRIMEIRO DÍGITO DO CEP -> UF DE REFERÊNCIA DA FAIXA (usado só como estimativa)
+# 0-1 SP | 2 RJ/ES | 3 MG | 4 BA/SE | 5 PE/AL/PB/RN | 6 CE/PI/MA/Norte | 7 DF/GO/Centro-Oeste | 8 PR/SC | 9 RS
+UF_REFERENCIA_POR_DIGITO = {
+    "0": "SP", "1": "SP", "2": "RJ", "3": "MG", "4": "BA",
+    "5": "PE", "6": "CE", "7": "DF", "8": "PR", "9": "RS"
+}
+
+def estimar_frete_por_regiao(cep: str) -> dict:
+    """
+    Frete estimado para CEP fora da tabela de faixas com o ViaCEP fora do ar:
+    a região vem do primeiro dígito do CEP e o valor da TABELA_FRETES
+    """
+    uf_referencia = UF_REFERENCIA_POR_DIGITO.get(cep[0], "")
+    valor_frete, prazo_estimado = calcular_frete_por_localizacao({"uf": uf_referencia})
+    return {
+        "endereco": "",
+        "cep": cep,
+        "valor_frete": valor_frete,
+        "prazo_estimado_dias": prazo_estimado,
+        "cidade": "",
+        "estado": "",
+        "regiao": encontrar_regiao_por_estado(uf_referencia),
+        "status": "estimativa (consulta de CEP indisponível)"
+    }
 
 def calcular_frete_por_localizacao(dados_destino: dict) -> tuple:
     """
@@ -148,5 +223,89 @@ def consultar_tabela_frete():
     return {
         "loja": LOJA_CONFIG,
         "tabela_fretes": TABELA_FRETES,
-        "regioes": REGIOES_BRASIL
-    }
\ No newline at end of file
+        "regioes": REGIOES_BRASIL,
+        # 0 = regra desligada
+        "regras_carrinho": {
+            "peso_incluso_kg": FRETE_PESO_INCLUSO_KG,
+            "adicional_por_kg": FRETE_ADICIONAL_POR_KG,
+            "frete_gratis_acima": FRETE_GRATIS_ACIMA
+        }
+    }
+
+def aplicar_carrinho(cotacao: dict, carrinho: Optional[CarrinhoFrete]) -> dict:
+    """
+    Ajusta o frete de um CEP ao carrinho: adicional por kg acima do peso
+    incluso e frete grátis acima de FRETE_GRATIS_ACIMA. As duas regras são
+    opcionais e vêm desligadas (0): sem configurar, devolve o valor da
+    tabela, só com valor_frete_base ao lado
+    """
+    if "erro" in cotacao or not carrinho:
+        return cotacao
+
+    valor_frete = cotacao["valor_frete"]
+    peso_excedente = max(0.0, carrinho.peso_kg - FRETE_PESO_INCLUSO_KG)
+    valor_frete += peso_excedente * FRETE_ADICIONAL_POR_KG
+
+    if FRETE_GRATIS_ACIMA and carrinho.valor_total >= FRETE_GRATIS_ACIMA:
+        valor_frete = 0.0
+
+    return {**cotacao, "valor_frete": round(valor_frete, 2), "valor_frete_base": cotacao["valor_frete"]}
+
+# ROTA DE COTAÇÃO EM LOTE (INTEGRAÇÕES COM MARKETPLACES)
+@router.post("/api/frete/lote")
+async def calcular_frete_lote(
+    lote: LoteFreteRequest,
+    usuario: Usuario = Depends(get_usuario_atual)
+):
+    """
+    Cota o frete de vários pares (CEP, carrinho) numa chamada.
+    Cada CEP distinto é cotado uma única vez, no máximo
+    FRETE_LOTE_CONCORRENCIA ao mesmo tempo. A resposta é NDJSON (uma linha
+    JSON por item, na ordem do pedido), enviada conforme fica pronta.
+    Um CEP inválido gera uma linha com "erro" em vez de falhar o lote.
+    O carrinho de cada item só muda o valor se as regras por carrinho
+    (FRETE_ADICIONAL_POR_KG, FRETE_GRATIS_ACIMA) estiverem configuradas.
+    """
+    if not usuario:
+        raise HTTPException(status_code=401, detail="Usuário não autenticado")
+
+    if len(lote.itens) > FRETE_LOTE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"Máximo de {FRETE_LOTE_MAXIMO} itens por lote")
+
+    limite = asyncio.Semaphore(FRETE_LOTE_CONCORRENCIA)
+
+    async def cotar_com_limite(cep: str) -> dict:
+        async with limite:
+            try:
+                return await cotar_cep(cep, lote.com_endereco)
+            except HTTPException as e:
+                return {"cep": cep, "erro": e.detail}
+
+    ceps = [item.cep.replace("-", "").strip() for item in lote.itens]
+    cotacoes = {}  # cep -> Task (CEPs repetidos reaproveitam a mesma cotação)
+    for cep in ceps:
+        if cep not in cotacoes:
+            cotacoes[cep] = asyncio.ensure_future(cotar_com_limite(cep))
+
+    async def gerar_linhas():
+        try:
+            for indice, (cep, item) in enumerate(zip(ceps, lote.itens)):
+                cotacao = aplicar_carrinho(await cotacoes[cep], item.carrinho)
+                yield json.dumps({"indice": indice, **cotacao}, ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectou no meio: não continua cotando à toa
+            for tarefa in cotacoes.values():
+                tarefa.cancel()
+
+    return StreamingResponse(gerar_linhas(), media_type="application/x-ndjson")
+
+# ROTA DE MONITORAMENTO: ACERTOS/FALHAS DO CACHE DE CEP
+@router.get("/api/frete/cache")
+def estatisticas_cache_cep():
+    """
+    Retorna os contadores do cache de CEP (acertos, falhas, itens)
+    e o estado do disjuntor do ViaCEP
+    """
+    dados = cache_cep.estatisticas()
+    dados["viacep_disjuntor_aberto"] = disjuntor.aberto
+    return dados
\ No newline at end of file
@@ -1,12 +1,19 @@
 from auth_deps import get_usuario_atual  
 from fastapi import (
     APIRouter, Request, Form, UploadFile, File,
-    Depends, HTTPException, Cookie
+    Depends, HTTPException, Cookie, Query
 )
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from database import get_db
+from typing import Optional
+from database import get_db, get_db_leitura
+from estoque import estoque_disponivel, estoque_do_produto
+from catalogo import (
+    PAGINA_PADRAO, PAGINA_MAXIMA, invalidar_catalogo, obter_pagina_produtos,
+    obter_categorias, obter_indice_cores, obter_produto,
+    obter_cores_tamanhos_categoria, obter_produtos_categoria, obter_variacoes
+)
 from models import Produto, Categoria, VariacaoProduto,Usuario
 import os, shutil, uuid
 from auth_deps import get_usuario_atual 
@@ -60,7 +67,14 @@ def _ensure_image_obj(produto):
     except Exception:
         return 'default.png'
 
-async def salvar_imagem(imagem: UploadFile) -> str:
+def _outras_cores(produto, indice_cores):
+    """Cores dos OUTROS produtos da mesma categoria (a própria cor só entra se outro produto também a tiver)"""
+    if not produto["categoria_id"]:
+        return []
+    cores = indice_cores.get(produto["categoria_id"], {})
+    return [cor for cor, total in cores.items() if cor != produto["cor"] or total > 1]
+
+def salvar_imagem(imagem: UploadFile) -> str:
     if not imagem or imagem.filename == "":
         return ""
     nome_unico = f"{uuid.uuid4()}_{imagem.filename}"
@@ -70,7 +84,7 @@ async def salvar_imagem(imagem: UploadFile) -> str:
     return nome_unico
 
 # FUNÇÃO SIMPLES PARA CRIAR PRODUTO
-async def criar_produto_simples(
+def criar_produto_simples(
     nome: str, 
     preco: float, 
     quantidade: int, 
@@ -81,7 +95,7 @@ async def criar_produto_simples(
     imagem: UploadFile, 
     db: Session
 ):
-    nome_imagem = await salvar_imagem(imagem)
+    nome_imagem = salvar_imagem(imagem)
     novo = Produto(
         nome=nome,
         preco=preco,
@@ -106,10 +120,11 @@ async def criar_produto_simples(
     )
     db.add(variacao)
     db.commit()
+    invalidar_catalogo()
     
     return novo
 
-async def atualizar_produto(id: int, nome: str, preco: float, quantidade: int, tamanho: str, cor: str, descricao: str, imagem: UploadFile, db: Session):
+def atualizar_produto(id: int, nome: str, preco: float, quantidade: int, tamanho: str, cor: str, descricao: str, imagem: UploadFile, db: Session):
     produto = db.query(Produto).filter(Produto.id == id).first()
     if not produto:
         return None
@@ -127,13 +142,14 @@ async def atualizar_produto(id: int, nome: str, preco: float, quantidade: int, t
                 os.remove(os.path.join(UPLOAD_DIR, produto.imagem))
             except FileNotFoundError:
                 pass
-        produto.imagem = await salvar_imagem(imagem)
+        produto.imagem = salvar_imagem(imagem)
 
     db.commit()
+    invalidar_catalogo()
     db.refresh(produto)
     return produto
 
-async def deletar_produto(id: int, db: Session):
+def deletar_produto(id: int, db: Session):
     produto = db.query(Produto).filter(Produto.id == id).first()
     if produto:
         # ✅ PRIMEIRO: Deleta as variações do produto
@@ -156,6 +172,7 @@ async def deletar_produto(id: int, db: Session):
         
         db.delete(produto)
         db.commit()
+        invalidar_catalogo()
     
     return produto
 
@@ -173,22 +190,29 @@ def admin_cookie_required(
 
 # ----------------- ROTAS PÚBLICAS ----------------- #
 @router.get("/", response_class=HTMLResponse)
-async def listar(request: Request, db: Session = Depends(get_db), is_admin: str = Cookie(default="false"), usuario = Depends(get_usuario_atual)):
-    produtos = db.query(Produto).all()
-    categorias = db.query(Categoria).all()
+def listar(
+    request: Request,
+    cursor: Optional[int] = Query(None),
+    limite: int = Query(PAGINA_PADRAO, ge=1, le=PAGINA_MAXIMA),
+    categoria_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db_leitura),
+    is_admin: str = Cookie(default="false"),
+    usuario = Depends(get_usuario_atual)
+):
+    # ✅ Paginação por cursor: só a página pedida é carregada (servida do cache do catálogo)
+    pagina = obter_pagina_produtos(db, cursor, limite, categoria_id)
+    proximo_cursor = pagina["proximo_cursor"]
+    categorias = obter_categorias(db)
     
-    for produto in produtos:
-        _ensure_image_obj(produto)
-        
-        # ✅ VOLTA AO SISTEMA ANTERIOR (cores por categoria)
-        if produto.categoria_id:
-            produtos_mesma_categoria = db.query(Produto).filter(
-                Produto.categoria_id == produto.categoria_id,
-                Produto.id != produto.id
-            ).all()
-            produto.outras_cores = list(set([p.cor for p in produtos_mesma_categoria if p.cor]))
-        else:
-            produto.outras_cores = []
+    # ✅ Índice categoria -> cores calculado uma única vez (evita N+1)
+    indice_cores = obter_indice_cores(db)
+    
+    # ✅ VOLTA AO SISTEMA ANTERIOR (cores por categoria)
+    # Cópia do dict para não alterar a fotografia guardada no cache
+    produtos = [
+        dict(produto, outras_cores=_outras_cores(produto, indice_cores))
+        for produto in pagina["produtos"]
+    ]
     
     mostrar_admin = (is_admin == "true")
     
@@ -200,50 +224,35 @@ async def listar(request: Request, db: Session = Depends(get_db), is_admin: str
             "is_admin": mostrar_admin, 
             "usuario": usuario,
             "categorias": categorias,
-            "obter_cor_css": obter_cor_css
+            "obter_cor_css": obter_cor_css,
+            "proximo_cursor": proximo_cursor,
+            "limite": limite,
+            "categoria_id": categoria_id
         }
     )
 @router.get("/produtos/{id_produto}", response_class=HTMLResponse)
-async def detalhe(request: Request, id_produto: int, db: Session = Depends(get_db), is_admin: str = Cookie(default="false"), usuario = Depends(get_usuario_atual)):
-    produto = db.query(Produto).filter(Produto.id == id_produto).first()
+def detalhe(request: Request, id_produto: int, db: Session = Depends(get_db_leitura), is_admin: str = Cookie(default="false"), usuario = Depends(get_usuario_atual)):
+    produto = obter_produto(db, id_produto)
     
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     
-    _ensure_image_obj(produto)
-    
-    # Buscar categoria do produto
-    categoria = db.query(Categoria).filter(Categoria.id == produto.categoria_id).first() if produto.categoria_id else None
-    
-    # Buscar cores e tamanhos disponíveis
-    if produto.categoria_id:
-        # Busca produtos com mesma categoria
-        produtos_mesma_categoria = db.query(Produto).filter(
-            Produto.categoria_id == produto.categoria_id
-        ).all()
+    # Buscar cores e tamanhos disponíveis (produtos da mesma categoria)
+    if produto["categoria_id"]:
+        cores, tamanhos = obter_cores_tamanhos_categoria(db, produto["categoria_id"])
     else:
-        produtos_mesma_categoria = [produto]
-    
-    # Extrai cores e tamanhos únicos
-    todas_cores = []
-    todos_tamanhos = []
+        cores, tamanhos = [], []
     
-    for p in produtos_mesma_categoria:
-        if p.cor:
-            todas_cores.append(p.cor)
-        if p.tamanho:
-            todos_tamanhos.append(p.tamanho)
-    
-    # Remove duplicatas e garante que o produto atual esteja incluído
-    cores_disponiveis = list(set(todas_cores))
-    tamanhos_disponiveis = list(set(todos_tamanhos))
+    # Copia as listas (as do cache não podem ser alteradas)
+    cores_disponiveis = list(cores)
+    tamanhos_disponiveis = list(tamanhos)
     
     # Garante que a cor e tamanho do produto atual estejam na lista
-    if produto.cor and produto.cor not in cores_disponiveis:
-        cores_disponiveis.append(produto.cor)
+    if produto["cor"] and produto["cor"] not in cores_disponiveis:
+        cores_disponiveis.append(produto["cor"])
     
-    if produto.tamanho and produto.tamanho not in tamanhos_disponiveis:
-        tamanhos_disponiveis.append(produto.tamanho)
+    if produto["tamanho"] and produto["tamanho"] not in tamanhos_disponiveis:
+        tamanhos_disponiveis.append(produto["tamanho"])
     
     # Ordena cores por uma ordem específica se quiser
     ordem_cores = ['BRANCA', 'PRETA', 'CINZA', 'AZUL', 'VERMELHA', 'VERDE', 'BEGE', 'ROSA']
@@ -253,12 +262,16 @@ async def detalhe(request: Request, id_produto: int, db: Session = Depends(get_d
     ordem_tamanhos = ['PP', 'P', 'M', 'G', 'GG']
     tamanhos_disponiveis.sort(key=lambda x: ordem_tamanhos.index(x) if x in ordem_tamanhos else len(ordem_tamanhos))
     
+    # Estoque livre (fora do cache: muda a cada carrinho)
+    quantidade_disponivel = estoque_disponivel(db, produto["id"])
+    
     mostrar_admin = (is_admin == "true")
     return templates.TemplateResponse(
         "produto.html",
         {
             "request": request, 
             "produto": produto, 
+            "quantidade_disponivel": quantidade_disponivel,
             "is_admin": mostrar_admin, 
             "usuario": usuario,
             "cores_disponiveis": cores_disponiveis,
@@ -267,33 +280,35 @@ async def detalhe(request: Request, id_produto: int, db: Session = Depends(get_d
         }
     )
 @router.get("/api/produto/{produto_id}")
-async def obter_produto_detalhes(produto_id: int, db: Session = Depends(get_db)):
+def obter_produto_detalhes(produto_id: int, db: Session = Depends(get_db_leitura)):
     """Retorna detalhes completos de um produto"""
-    produto = db.query(Produto).filter(Produto.id == produto_id).first()
+    produto = obter_produto(db, produto_id)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     
-    categoria = db.query(Categoria).filter(Categoria.id == produto.categoria_id).first() if produto.categoria_id else None
+    # Estoque lido do banco (não fica no cache do catálogo)
+    quantidade, disponivel = estoque_do_produto(db, produto_id)
     
     return {
-        "id": produto.id,
-        "nome": produto.nome,
-        "descricao": produto.descricao,
-        "preco": float(produto.preco),
-        "quantidade": produto.quantidade,
-        "cor": produto.cor,
-        "tamanho": produto.tamanho,
-        "imagem": produto.imagem,
-        "categoria_id": produto.categoria_id,
-        "categoria": categoria.nome if categoria else None
+        "id": produto["id"],
+        "nome": produto["nome"],
+        "descricao": produto["descricao"],
+        "preco": produto["preco"],
+        "quantidade": quantidade,
+        "disponivel": disponivel,
+        "cor": produto["cor"],
+        "tamanho": produto["tamanho"],
+        "imagem": produto["imagem"],
+        "categoria_id": produto["categoria_id"],
+        "categoria": produto["categoria"]["nome"] if produto["categoria"] else None
     }
 # Adicione esta rota ao produtos_controller.py
 @router.get("/api/produto/buscar-por-cor-tamanho")
-async def buscar_produto_por_cor_tamanho(
+def buscar_produto_por_cor_tamanho(
     nome: str,
     cor: str,
     tamanho: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
     Busca um produto pelo nome, cor e tamanho
@@ -340,11 +355,11 @@ async def buscar_produto_por_cor_tamanho(
     return None
 # Adicione esta rota no produtos_controller.py (antes ou depois das outras rotas de API)
 @router.get("/api/produto/buscar")
-async def buscar_produto_por_cor_tamanho(
+def buscar_produto_por_cor_tamanho(
     nome: str,
     cor: str,
     tamanho: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
     Busca um produto pelo nome, cor e tamanho
@@ -413,7 +428,7 @@ async def buscar_produto_por_cor_tamanho(
     return None
 # ----------------- LISTA ADMIN ----------------- #
 @router.get("/lista_adm", response_class=HTMLResponse, dependencies=[Depends(admin_cookie_required)])
-async def lista_admin(request: Request, admin_user: str = Cookie(default=""), db: Session = Depends(get_db)):
+def lista_admin(request: Request, admin_user: str = Cookie(default=""), db: Session = Depends(get_db)):
     produtos = db.query(Produto).all()
     for produto in produtos:
         _ensure_image_obj(produto)
@@ -429,9 +444,9 @@ async def lista_admin(request: Request, admin_user: str = Cookie(default=""), db
 
 # Adicione esta rota no produtos_controller.py
 @router.get("/api/produto/variacoes")
-async def buscar_variacoes_produto(
+def buscar_variacoes_produto(
     nome: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_leitura)
 ):
     """
     Busca todas as variações (cores/tamanhos) de um produto pelo nome
@@ -496,7 +511,7 @@ async def login_adm(request: Request, username: str = Form(...), password: str =
 
 # ----------------- ROTAS ADMIN ----------------- #
 @router.get("/novo", response_class=HTMLResponse, dependencies=[Depends(admin_cookie_required)])
-async def form_novo(request: Request, db: Session = Depends(get_db)):
+def form_novo(request: Request, db: Session = Depends(get_db)):
     categorias = db.query(Categoria).all()
     return templates.TemplateResponse("novo.html", {
         "request": request, 
@@ -505,7 +520,7 @@ async def form_novo(request: Request, db: Session = Depends(get_db)):
 
 # ✅ ROTA SIMPLIFICADA - APENAS CATEGORIA
 @router.post("/novo", dependencies=[Depends(admin_cookie_required)])
-async def criar(
+def criar(
     nome: str = Form(...),
     preco: float = Form(...),
     quantidade: int = Form(...),
@@ -516,13 +531,13 @@ async def criar(
     imagem: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    await criar_produto_simples(
+    criar_produto_simples(
         nome, preco, quantidade, tamanho, cor, descricao, categoria_id, imagem, db
     )
     return RedirectResponse("/lista_adm", status_code=303)
 
 @router.get("/editar/{id}", response_class=HTMLResponse, dependencies=[Depends(admin_cookie_required)])
-async def form_editar(id: int, request: Request, db: Session = Depends(get_db)):
+def form_editar(id: int, request: Request, db: Session = Depends(get_db)):
     produto = db.query(Produto).filter(Produto.id == id).first()
     _ensure_image_obj(produto)
     categorias = db.query(Categoria).all()  # ✅ PARA O SELECT DE CATEGORIAS
@@ -533,7 +548,7 @@ async def form_editar(id: int, request: Request, db: Session = Depends(get_db)):
     })
 
 @router.post("/editar/{id}", dependencies=[Depends(admin_cookie_required)])
-async def editar(
+def editar(
     id: int,
     nome: str = Form(...),
     preco: float = Form(...),
@@ -563,34 +578,31 @@ async def editar(
                 os.remove(os.path.join(UPLOAD_DIR, produto.imagem))
             except FileNotFoundError:
                 pass
-        produto.imagem = await salvar_imagem(imagem)
+        produto.imagem = salvar_imagem(imagem)
     
     db.commit()
+    invalidar_catalogo()
     return RedirectResponse("/lista_adm", status_code=303)
 
 @router.get("/deletar/{id}", dependencies=[Depends(admin_cookie_required)])
-async def deletar(id: int, db: Session = Depends(get_db)):
-    await deletar_produto(id, db)
+def deletar(id: int, db: Session = Depends(get_db)):
+    deletar_produto(id, db)
     return RedirectResponse("/lista_adm", status_code=303)
 
 # ----------------- ROTAS DE CATEGORIA ----------------- #
 @router.get("/categoria/{categoria_id}", response_class=HTMLResponse)
-async def produtos_por_categoria(
+def produtos_por_categoria(
     request: Request, 
     categoria_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_leitura),
     usuario = Depends(get_usuario_atual)
 ):
-    categoria = db.query(Categoria).filter(Categoria.id == categoria_id).first()
-    produtos = db.query(Produto).filter(Produto.categoria_id == categoria_id).all()
-    
-    for produto in produtos:
-        _ensure_image_obj(produto)
+    dados = obter_produtos_categoria(db, categoria_id)
     
     return templates.TemplateResponse("categoria.html", {
         "request": request,
-        "categoria": categoria,
-        "produtos": produtos,
+        "categoria": dados["categoria"],
+        "produtos": dados["produtos"],
         "usuario": usuario
     })
 
@@ -608,7 +620,7 @@ async def mostrar_carrinho(request: Request, usuario: Usuario = Depends(get_usua
 
 # ✅ ROTA DO CHECKOUT (adicionar no final do arquivo)
 @router.get("/checkout", response_class=HTMLResponse)
-async def checkout_page(
+def checkout_page(
     request: Request,
     usuario: Usuario = Depends(get_usuario_atual),  # ✅ AGORA Usuario ESTÁ IMPORTADO
     db: Session = Depends(get_db)
@@ -636,27 +648,12 @@ async def busca(request: Request):
     return templates.TemplateResponse("busca.html", {"request": request})
 
 @router.get("/api/produto/{produto_id}/variacoes")
-async def obter_variacoes_produto(produto_id: int, db: Session = Depends(get_db)):
+def obter_variacoes_produto(produto_id: int, db: Session = Depends(get_db_leitura)):
     """Retorna todas as variações de um produto"""
-    variacoes = db.query(VariacaoProduto).filter(
-        VariacaoProduto.produto_id == produto_id
-    ).all()
-    
-    variacoes_data = []
-    for variacao in variacoes:
-        variacoes_data.append({
-            "id": variacao.id,
-            "cor": variacao.cor,
-            "tamanho": variacao.tamanho,
-            "quantidade": variacao.quantidade,
-            "imagem": variacao.imagem,
-            "preco": variacao.produto.preco  # Preço do produto principal
-        })
-    
-    return JSONResponse(variacoes_data)
+    return JSONResponse(obter_variacoes(db, produto_id))
 
 @router.get("/debug-produtos")
-async def debug_produtos(db: Session = Depends(get_db)):
+def debug_produtos(db: Session = Depends(get_db)):
     produtos = db.query(Produto).all()
     debug_info = []
     
@@ -677,7 +674,7 @@ async def debug_produtos(db: Session = Depends(get_db)):
     return JSONResponse(debug_info)
 
 @router.get("/api/produto/{produto_id}/cores-tamanhos")
-async def obter_cores_tamanhos_produto(produto_id: int, db: Session = Depends(get_db)):
+def obter_cores_tamanhos_produto(produto_id: int, db: Session = Depends(get_db_leitura)):
     """Retorna cores e tamanhos disponíveis para produtos com mesmo nome e categoria"""
     produto_atual = db.query(Produto).filter(Produto.id == produto_id).first()
     if not produto_atual:
@@ -704,7 +701,7 @@ async def obter_cores_tamanhos_produto(produto_id: int, db: Session = Depends(ge
     })
 
 @router.get("/debug-simples/{produto_id}")
-async def debug_simples(produto_id: int, db: Session = Depends(get_db)):
+def debug_simples(produto_id: int, db: Session = Depends(get_db)):
     """Debug simples para ver produto e variações"""
     produto = db.query(Produto).filter(Produto.id == produto_id).first()
     variacoes = db.query(VariacaoProduto).filter(VariacaoProduto.produto_id == produto_id).all()
@@ -2,11 +2,15 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from auth_deps import get_usuario_atual
+from auth_deps import get_usuario_atual, regravar_hash_senha
 from database import get_db
 from models import Usuario
-from auth import gerar_hash_senha, verificar_senha, criar_token, verificar_token
+from auth import (
+    gerar_hash_senha, verificar_e_atualizar_senha, criar_token, verificar_token,
+    estatisticas_senhas, ServicoSenhasOcupado
+)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -16,9 +20,20 @@ templates = Jinja2Templates(directory="templates")
 def pagina_cadastro(request: Request):
     return templates.TemplateResponse("cadastro.html", {"request": request})
 
+# Login e cadastro são async: o hash de senha é esperado com await (sem
+# prender uma thread do threadpool) e o acesso ao banco vai para o threadpool
+
+def _buscar_por_email(db: Session, email: str):
+    return db.query(Usuario).filter(Usuario.email == email).first()
+
+def _criar_usuario(db: Session, nome: str, email: str, telefone: str, senha_hash: str):
+    novo_usuario = Usuario(nome=nome, email=email, telefone=telefone, senha=senha_hash)
+    db.add(novo_usuario)
+    db.commit()
+
 # CADASTRO (POST)
 @router.post("/register", response_class=HTMLResponse)
-def cadastrar_usuario(
+async def cadastrar_usuario(
     request: Request,
     nome: str = Form(...),
     email: str = Form(...),
@@ -27,16 +42,20 @@ def cadastrar_usuario(
     db: Session = Depends(get_db)
 ):
     # Verifica se já existe
-    usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    usuario = await run_in_threadpool(_buscar_por_email, db, email)
     if usuario:
         return templates.TemplateResponse("cadastro.html", {"request": request, "mensagem": "E-mail já cadastrado!"})
 
-    # Cria usuário
-    senha_hash = gerar_hash_senha(senha)
-    novo_usuario = Usuario(nome=nome, email=email, telefone=telefone, senha=senha_hash)
-    db.add(novo_usuario)
-    db.commit()
-    db.refresh(novo_usuario)
+    # Cria usuário (o hash roda no pool de processos de senha)
+    try:
+        senha_hash = await gerar_hash_senha(senha)
+    except ServicoSenhasOcupado:
+        return templates.TemplateResponse(
+            "cadastro.html",
+            {"request": request, "mensagem": "Servidor ocupado, tente novamente em instantes"},
+            status_code=503
+        )
+    await run_in_threadpool(_criar_usuario, db, nome, email, telefone, senha_hash)
 
     # Após cadastrar, redireciona para login
     return RedirectResponse(url="/login", status_code=303)
@@ -48,18 +67,33 @@ def pagina_login(request: Request):
 
 # LOGIN (POST)
 @router.post("/login")
-def login(
+async def login(
     request: Request,
     email: str = Form(...),
     senha: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    usuario = db.query(Usuario).filter(Usuario.email == email).first()
+    usuario = await run_in_threadpool(_buscar_por_email, db, email)
+
+    senha_confere, novo_hash = False, None
+    if usuario:
+        try:
+            senha_confere, novo_hash = await verificar_e_atualizar_senha(senha, usuario.senha)
+        except ServicoSenhasOcupado:
+            return templates.TemplateResponse(
+                "login.html",
+                {"request": request, "mensagem": "Servidor ocupado, tente novamente em instantes"},
+                status_code=503
+            )
 
     # usuário não encontrado ou senha inválida -> renderiza login com mensagem
-    if not usuario or not verificar_senha(senha, usuario.senha):
+    if not senha_confere:
         return templates.TemplateResponse("login.html", {"request": request, "mensagem": "Credenciais inválidas"})
 
+    # Hash feito com parâmetros antigos do argon2: regrava com os atuais
+    if novo_hash:
+        await run_in_threadpool(regravar_hash_senha, db, usuario, novo_hash)
+
     # cria token JWT (payload com sub=email)
     token = criar_token({"sub": usuario.email})
     response = RedirectResponse(url="/home", status_code=303)
@@ -98,3 +132,8 @@ def debug_cookies(request: Request):
     }
 
 
+
+# Monitoramento do pool de hash de senha (argon2)
+@router.get("/api/senhas/fila")
+def fila_senhas():
+    return estatisticas_senhas()
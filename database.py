@@ -1,25 +1,186 @@
-from sqlalchemy import create_engine
+import itertools
+import os
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, exc, text
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from urllib.parse import quote_plus
 
 # =========================
 # CONFIGURAÇÃO DO BANCO (MySQL)
 # =========================
-DB_USER = "root"
-DB_PASS = quote_plus("dev1t@24")  # codifica o @ corretamente
-DB_HOST = "localhost"
-DB_PORT = "3306"
-DB_NAME = "banco"
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASS = quote_plus(os.getenv("DB_PASS", "dev1t@24"))  # codifica o @ corretamente
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "3306")
+DB_NAME = os.getenv("DB_NAME", "banco")
 
 DATABASE_URL = f"mysql+mysqlconnector://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# =========================
+# POOL DE CONEXÕES
+# =========================
+# Cada worker tem o próprio pool: o total de conexões abertas no MySQL
+# chega a workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))    # espera máxima por uma conexão livre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # abaixo do wait_timeout do MySQL
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "sim")
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "sim")
+
+class PoolMonitorado(QueuePool):
+    """
+    QueuePool que mede quanto tempo cada pedido de conexão esperou
+    (checkout) e quantas vezes o pool esgotou (timeout)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock_metricas = threading.Lock()
+        self.checkouts = 0
+        self.esgotamentos = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._lock_metricas:
+                self.esgotamentos += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._lock_metricas:
+                self.checkouts += 1
+                self.espera_total += espera
+                self.espera_maxima = max(self.espera_maxima, espera)
+
+    def metricas(self) -> dict:
+        with self._lock_metricas:
+            return {
+                "tamanho": self.size(),
+                "em_uso": self.checkedout(),
+                "livres": self.checkedin(),
+                "overflow": self.overflow(),
+                "max_overflow": self._max_overflow,
+                "checkouts": self.checkouts,
+                "esgotamentos": self.esgotamentos,
+                "espera_media_ms": round(self.espera_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "espera_maxima_ms": round(self.espera_maxima * 1000, 3)
+            }
+
 # =========================
 # ENGINE E SESSÃO
 # =========================
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+def criar_engine(url: str):
+    return create_engine(
+        url,
+        poolclass=PoolMonitorado,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        echo=DB_ECHO
+    )
+
+engine = criar_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# =========================
+# RÉPLICAS DE LEITURA
+# =========================
+# DATABASE_REPLICA_URLS: URLs separadas por vírgula. Sem réplicas, tudo vai
+# para o primário. Leituras de catálogo e histórico usam get_db_leitura;
+# escritas e checkout continuam em get_db (primário).
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_VERIFICACAO_SEGUNDOS = float(os.getenv("REPLICA_VERIFICACAO_SEGUNDOS", "10"))
+
+# Read-your-writes: depois de alterar o carrinho/pedido o navegador lê do
+# primário por LEITURA_PRIMARIO_SEGUNDOS (a réplica pode estar atrasada)
+LEITURA_PRIMARIO_SEGUNDOS = int(os.getenv("LEITURA_PRIMARIO_SEGUNDOS", "5"))
+COOKIE_LEITURA_PRIMARIO = "ler_primario_ate"
+
+class RoteadorReplicas:
+    """
+    Escolhe a réplica em rodízio (round-robin), pulando as que falharam na
+    última verificação (SELECT 1, refeita a cada REPLICA_VERIFICACAO_SEGUNDOS)
+    """
+
+    def __init__(self, urls: list):
+        self.engines = [criar_engine(url) for url in urls]
+        self._rodizio = itertools.count()
+        self._lock = threading.Lock()
+        self._saudavel = [True] * len(self.engines)
+        self._verificado_em = [0.0] * len(self.engines)
+
+    def _esta_saudavel(self, indice: int) -> bool:
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._verificado_em[indice] < REPLICA_VERIFICACAO_SEGUNDOS:
+                return self._saudavel[indice]
+            self._verificado_em[indice] = agora  # só uma thread verifica por vez
+
+        try:
+            with self.engines[indice].connect() as conexao:
+                conexao.execute(text("SELECT 1"))
+            saudavel = True
+        except exc.SQLAlchemyError as e:
+            print(f"❌ Réplica {indice} fora do ar: {e}")
+            saudavel = False
+
+        with self._lock:
+            self._saudavel[indice] = saudavel
+        return saudavel
+
+    def escolher(self):
+        """Engine de uma réplica saudável, ou None (usar o primário)"""
+        for _ in range(len(self.engines)):
+            indice = next(self._rodizio) % len(self.engines)
+            if self._esta_saudavel(indice):
+                return self.engines[indice]
+        return None
+
+    def estado(self) -> list:
+        with self._lock:
+            return [
+                {"replica": indice, "saudavel": self._saudavel[indice], "pool": e.pool.metricas()}
+                for indice, e in enumerate(self.engines)
+            ]
+
+roteador_replicas = RoteadorReplicas(DATABASE_REPLICA_URLS)
+
+def marcar_leitura_no_primario(response):
+    """Chamar na resposta de toda rota que altera carrinho/pedidos do usuário"""
+    ate = int(time.time()) + LEITURA_PRIMARIO_SEGUNDOS
+    response.set_cookie(
+        COOKIE_LEITURA_PRIMARIO, str(ate),
+        max_age=LEITURA_PRIMARIO_SEGUNDOS, httponly=True, samesite="lax", path="/"
+    )
+    return response
+
+def _deve_ler_do_primario(request: Request) -> bool:
+    try:
+        return int(request.cookies.get(COOKIE_LEITURA_PRIMARIO, "0")) > time.time()
+    except ValueError:
+        return False
+
+def sessao_em_replica(db) -> bool:
+    return db.get_bind() in roteador_replicas.engines
+
+def metricas_pool() -> dict:
+    """Estado atual e métricas de espera do pool de conexões (primário e réplicas)"""
+    dados = engine.pool.metricas()
+    if roteador_replicas.engines:
+        dados["replicas"] = roteador_replicas.estado()
+    return dados
+
 # =========================
 # DEPENDÊNCIA PARA USO NAS ROTAS FASTAPI
 # =========================
@@ -28,4 +189,18 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_db_leitura(request: Request):
+    """
+    Sessão para rotas só de leitura: usa uma réplica, salvo se não houver
+    réplica saudável ou se o usuário acabou de escrever (read-your-writes)
+    """
+    replica = None
+    if roteador_replicas.engines and not _deve_ler_do_primario(request):
+        replica = roteador_replicas.escolher()
+    db = SessionLocal(bind=replica) if replica is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,24 @@
+# estatisticas.py
+# Reconstrói a tabela estatisticas_usuarios a partir dos pedidos.
+# Use para preencher bancos existentes (backfill) ou corrigir divergências.
+# Uso: python estatisticas.py [usuario_id]
+import sys
+from database import SessionLocal, engine
+from models import EstatisticasUsuario
+from pedidos import reconstruir_estatisticas
+
+def reconstruir(usuario_id: int = None):
+    EstatisticasUsuario.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        print("🔄 Recalculando estatísticas de pedidos por usuário...")
+        total = reconstruir_estatisticas(db, usuario_id)
+        print(f"✅ Estatísticas de {total} usuário(s) reconstruídas com sucesso!")
+    except Exception as e:
+        print(f"❌ Erro ao reconstruir estatísticas: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    reconstruir(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,172 @@
+# estoque.py
+import asyncio
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import case, update, select, func
+from sqlalchemy.orm import Session
+from models import Produto, ReservaEstoque
+
+# =========================
+# RESERVAS DE ESTOQUE
+# =========================
+# Ao colocar um produto no carrinho as unidades ficam reservadas por
+# RESERVA_MINUTOS (renovado a cada alteração do item). Reservas vencidas
+# deixam de contar e são apagadas pela varredura em segundo plano.
+RESERVA_MINUTOS = int(os.getenv("RESERVA_MINUTOS", "15"))
+VARREDURA_SEGUNDOS = int(os.getenv("RESERVA_VARREDURA_SEGUNDOS", "60"))
+
+def _reservado_por_outros(agora: datetime, pedido_id: int = None):
+    """Subconsulta: unidades do produto reservadas (e não vencidas) por outros carrinhos"""
+    filtro = [
+        ReservaEstoque.produto_id == Produto.id,
+        ReservaEstoque.expira_em > agora
+    ]
+    if pedido_id is not None:
+        filtro.append(ReservaEstoque.pedido_id != pedido_id)
+    return select(
+        func.coalesce(func.sum(ReservaEstoque.quantidade), 0)
+    ).where(*filtro).correlate(Produto).scalar_subquery()
+
+def _disponivel(agora: datetime, pedido_id: int = None):
+    """Expressão SQL: estoque − reservas ativas dos outros carrinhos"""
+    return Produto.quantidade - _reservado_por_outros(agora, pedido_id)
+
+def estoque_disponivel(db: Session, produto_id: int, pedido_id: int = None) -> int:
+    """
+    Unidades que ainda podem ir para um carrinho (uma única consulta).
+    Com pedido_id, as reservas do próprio carrinho não são descontadas.
+    """
+    disponivel = db.query(_disponivel(datetime.utcnow(), pedido_id)).filter(
+        Produto.id == produto_id
+    ).scalar()
+    return max(int(disponivel), 0) if disponivel is not None else 0
+
+def estoque_do_produto(db: Session, produto_id: int):
+    """(quantidade em estoque, unidades livres para carrinho) numa única consulta; (0, 0) se não existe"""
+    linha = db.query(Produto.quantidade, _disponivel(datetime.utcnow())).filter(
+        Produto.id == produto_id
+    ).first()
+    if not linha:
+        return 0, 0
+    return int(linha[0]), max(int(linha[1]), 0)
+
+def reservar_item(db: Session, item):
+    """Cria ou renova a reserva do item do carrinho com a quantidade atual dele"""
+    expira_em = datetime.utcnow() + timedelta(minutes=RESERVA_MINUTOS)
+    reserva = db.query(ReservaEstoque).filter(
+        ReservaEstoque.item_pedido_id == item.id
+    ).first()
+    if reserva:
+        reserva.quantidade = item.quantidade
+        reserva.expira_em = expira_em
+    else:
+        db.add(ReservaEstoque(
+            item_pedido_id=item.id,
+            pedido_id=item.pedido_id,
+            produto_id=item.produto_id,
+            quantidade=item.quantidade,
+            expira_em=expira_em
+        ))
+
+def liberar_reserva_item(db: Session, item_pedido_id: int):
+    db.query(ReservaEstoque).filter(
+        ReservaEstoque.item_pedido_id == item_pedido_id
+    ).delete(synchronize_session=False)
+
+def liberar_reservas_pedido(db: Session, pedido_id: int):
+    db.query(ReservaEstoque).filter(
+        ReservaEstoque.pedido_id == pedido_id
+    ).delete(synchronize_session=False)
+
+def remover_reservas_expiradas(db: Session) -> int:
+    removidas = db.query(ReservaEstoque).filter(
+        ReservaEstoque.expira_em <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removidas
+
+def _varrer_uma_vez():
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        removidas = remover_reservas_expiradas(db)
+        if removidas:
+            print(f"🧹 {removidas} reserva(s) de estoque vencida(s) removida(s)")
+    except Exception as e:
+        print(f"❌ Erro ao remover reservas vencidas: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+async def varrer_reservas_expiradas():
+    """Tarefa de fundo (iniciada no startup do app) que apaga reservas vencidas"""
+    while True:
+        await asyncio.sleep(VARREDURA_SEGUNDOS)
+        await asyncio.to_thread(_varrer_uma_vez)
+
+# =========================
+# BAIXA / DEVOLUÇÃO DE ESTOQUE
+# =========================
+def somar_quantidades(itens) -> dict:
+    """Agrupa [(produto_id, quantidade), ...] em {produto_id: quantidade_total}"""
+    quantidades = {}
+    for produto_id, quantidade in itens:
+        quantidades[produto_id] = quantidades.get(produto_id, 0) + int(quantidade)
+    return quantidades
+
+def baixar_estoque(db: Session, quantidades: dict, pedido_id: int = None) -> list:
+    """
+    Dá baixa no estoque de todos os produtos em UM único UPDATE condicional:
+
+        UPDATE produtos
+           SET quantidade = quantidade - CASE id WHEN .. THEN .. END
+         WHERE id IN (..)
+           AND quantidade - (reservas ativas de outros carrinhos) >= CASE id WHEN .. THEN .. END
+
+    A checagem e a baixa acontecem na mesma instrução (o banco trava as
+    linhas em ordem de id), então dois checkouts simultâneos não conseguem
+    vender a mesma unidade. Com pedido_id, as reservas desse pedido não
+    contam contra ele.
+
+    Retorna [] se todos os produtos tinham estoque. Caso contrário desfaz a
+    transação inteira (rollback) e retorna os nomes dos produtos sem estoque.
+    """
+    if not quantidades:
+        return []
+
+    ids = sorted(quantidades)
+    pedida = case(quantidades, value=Produto.id)
+    agora = datetime.utcnow()
+
+    resultado = db.execute(
+        update(Produto)
+        .where(Produto.id.in_(ids), _disponivel(agora, pedido_id) >= pedida)
+        .values(quantidade=Produto.quantidade - pedida)
+        .execution_options(synchronize_session=False)
+    )
+
+    if resultado.rowcount == len(ids):
+        return []
+
+    db.rollback()
+    produtos = db.query(
+        Produto.id, Produto.nome, _disponivel(agora, pedido_id).label("disponivel")
+    ).filter(Produto.id.in_(ids)).all()
+    encontrados = {p.id: p for p in produtos}
+    return [
+        encontrados[produto_id].nome if produto_id in encontrados else f"Produto {produto_id}"
+        for produto_id in ids
+        if produto_id not in encontrados or encontrados[produto_id].disponivel < quantidades[produto_id]
+    ]
+
+def devolver_estoque(db: Session, quantidades: dict):
+    """Devolve ao estoque (ex.: pedido cancelado) em um único UPDATE"""
+    if not quantidades:
+        return
+    devolvida = case(quantidades, value=Produto.id)
+    db.execute(
+        update(Produto)
+        .where(Produto.id.in_(sorted(quantidades)))
+        .values(quantidade=Produto.quantidade + devolvida)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,61 @@
+# faixas_cep.py
+import csv
+import os
+from bisect import bisect_right
+
+# =========================
+# TABELA OFFLINE DE FAIXAS DE CEP
+# =========================
+# Faixas de CEP dos Correios (CEP inicial/final -> UF e, quando a faixa é
+# toda de uma cidade, o nome dela). Basta para calcular o frete, que só
+# depende de UF/cidade, sem nenhuma consulta de rede.
+# O arquivo pode ser trocado por um mais detalhado em FAIXAS_CEP_CSV,
+# desde que as faixas não se sobreponham.
+
+FAIXAS_CEP_CSV = os.getenv(
+    "FAIXAS_CEP_CSV",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "faixas_cep.csv")
+)
+
+class TabelaFaixasCEP:
+    """Faixas ordenadas pelo CEP inicial; a busca é binária (bisect)"""
+
+    def __init__(self, faixas: list):
+        self._faixas = sorted(faixas)
+        self._inicios = [faixa[0] for faixa in self._faixas]
+
+        for anterior, atual in zip(self._faixas, self._faixas[1:]):
+            if atual[0] <= anterior[1]:
+                raise ValueError(f"Faixas de CEP sobrepostas: {anterior[:2]} e {atual[:2]}")
+
+    def __len__(self):
+        return len(self._faixas)
+
+    def localizar(self, cep: str):
+        """{'uf': ..., 'localidade': ...} da faixa do CEP, ou None se nenhuma faixa cobre o CEP"""
+        numero = int(cep)
+        posicao = bisect_right(self._inicios, numero) - 1
+        if posicao < 0:
+            return None
+        inicio, fim, uf, cidade = self._faixas[posicao]
+        if numero > fim:
+            return None
+        return {"uf": uf, "localidade": cidade}
+
+def carregar_faixas(caminho: str) -> TabelaFaixasCEP:
+    faixas = []
+    with open(caminho, newline="", encoding="utf-8") as arquivo:
+        for linha in csv.DictReader(arquivo):
+            faixas.append((
+                int(linha["cep_inicial"]),
+                int(linha["cep_final"]),
+                linha["uf"].strip().upper(),
+                (linha.get("cidade") or "").strip()
+            ))
+    return TabelaFaixasCEP(faixas)
+
+try:
+    tabela_faixas_cep = carregar_faixas(FAIXAS_CEP_CSV)
+except (OSError, ValueError, KeyError) as e:
+    print(f"❌ Erro ao carregar faixas de CEP ({FAIXAS_CEP_CSV}): {e}")
+    tabela_faixas_cep = TabelaFaixasCEP([])
@@ -0,0 +1,127 @@
+# idempotencia.py
+# Chaves de idempotência (cabeçalho Idempotency-Key) das rotas de finalização.
+# O cliente gera uma chave por compra e a reenvia nas retentativas; a resposta
+# da primeira execução fica guardada por IDEMPOTENCIA_HORAS e as repetições
+# recebem essa mesma resposta sem tocar em estoque ou pedidos.
+#
+# A chave é gravada na MESMA transação do pedido: se o pedido não for
+# confirmado (erro, estoque insuficiente), a chave também some e a
+# retentativa executa de novo. Duas requisições simultâneas com a mesma
+# chave se serializam no INSERT da chave primária: a segunda espera a
+# primeira terminar e devolve a resposta dela.
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import ChaveIdempotencia
+
+CABECALHO = "Idempotency-Key"
+IDEMPOTENCIA_HORAS = int(os.getenv("IDEMPOTENCIA_HORAS", "24"))
+VARREDURA_SEGUNDOS = int(os.getenv("IDEMPOTENCIA_VARREDURA_SEGUNDOS", "3600"))
+TAMANHO_MAXIMO_CHAVE = 255
+
+def impressao_requisicao(dados) -> str:
+    """sha256 do corpo da requisição (a mesma chave não pode vir com outro corpo)"""
+    return hashlib.sha256(json.dumps(dados, sort_keys=True, default=str).encode()).hexdigest()
+
+def _buscar(db: Session, escopo: str, chave: str):
+    # Leitura com trava: enxerga o que outra transação acabou de confirmar.
+    # Só é feita depois de o INSERT falhar, quando a linha existe (trava de
+    # registro, não de intervalo).
+    return db.query(ChaveIdempotencia).filter(
+        ChaveIdempotencia.escopo == escopo,
+        ChaveIdempotencia.chave == chave
+    ).with_for_update().first()
+
+def _repetir(registro: ChaveIdempotencia, impressao: str) -> JSONResponse:
+    if registro and registro.impressao != impressao:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{CABECALHO} já usada com outra requisição"
+        )
+    if not registro or registro.status_code is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Requisição com esta chave ainda em processamento"
+        )
+    return JSONResponse(
+        json.loads(registro.resposta),
+        status_code=registro.status_code,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+def reservar_chave(db: Session, chave: str, escopo: str, impressao: str):
+    """
+    Chamar no início da rota, antes de ler ou alterar qualquer coisa.
+    Retorna (resposta_guardada, None) se a chave já foi usada, ou
+    (None, registro) para a rota seguir e depois chamar guardar_resposta().
+    """
+    if len(chave) > TAMANHO_MAXIMO_CHAVE:
+        raise HTTPException(status_code=400, detail=f"{CABECALHO} muito longa")
+
+    agora = datetime.utcnow()
+    expira_em = agora + timedelta(hours=IDEMPOTENCIA_HORAS)
+
+    # INSERT primeiro, sem leitura antes: ler (ou apagar) uma chave que ainda
+    # não existe trava o intervalo no InnoDB, e duas retentativas simultâneas
+    # com a mesma chave travariam uma à outra (deadlock) no INSERT
+    registro = ChaveIdempotencia(escopo=escopo, chave=chave, impressao=impressao, expira_em=expira_em)
+    try:
+        with db.begin_nested():
+            db.add(registro)
+    except IntegrityError:
+        pass
+    else:
+        return None, registro
+
+    # A chave já existe (se outra requisição a estava gravando, o INSERT
+    # esperou ela terminar)
+    existente = _buscar(db, escopo, chave)
+    if existente and existente.expira_em <= agora:
+        # Chave vencida ainda não varrida: reaproveita a linha para esta requisição
+        existente.impressao = impressao
+        existente.status_code = None
+        existente.resposta = None
+        existente.expira_em = expira_em
+        db.flush()
+        return None, existente
+    return _repetir(existente, impressao), None
+
+def guardar_resposta(registro: ChaveIdempotencia, corpo: dict, status_code: int = 200):
+    """Chamar antes do db.commit() da rota, com o corpo que será devolvido"""
+    registro.status_code = status_code
+    registro.resposta = json.dumps(corpo, default=str)
+
+# =========================
+# LIMPEZA DAS CHAVES VENCIDAS
+# =========================
+def remover_chaves_expiradas(db: Session) -> int:
+    removidas = db.query(ChaveIdempotencia).filter(
+        ChaveIdempotencia.expira_em <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removidas
+
+def _varrer_uma_vez():
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        removidas = remover_chaves_expiradas(db)
+        if removidas:
+            print(f"🧹 {removidas} chave(s) de idempotência vencida(s) removida(s)")
+    except Exception as e:
+        print(f"❌ Erro ao remover chaves de idempotência vencidas: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+async def varrer_chaves_expiradas():
+    """Tarefa de fundo (iniciada no startup do app) que apaga chaves vencidas"""
+    while True:
+        await asyncio.sleep(VARREDURA_SEGUNDOS)
+        await asyncio.to_thread(_varrer_uma_vez)
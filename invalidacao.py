@@ -0,0 +1,102 @@
+# invalidacao.py
+import os
+import tempfile
+import threading
+import uuid
+
+# =========================
+# CANAL DE INVALIDAÇÃO ENTRE WORKERS
+# =========================
+# Com vários workers do uvicorn cada processo tem o seu próprio cache em
+# memória. Quem faz a escrita publica uma nova "versão" do escopo
+# (ex.: "catalogo") no canal; os outros workers comparam essa versão com
+# a última que viram e, se mudou, descartam o cache local.
+#
+# CACHE_INVALIDACAO:
+#   local           -> só o próprio processo (padrão, um único worker)
+#   arquivo         -> arquivo de versão em CACHE_INVALIDACAO_DIR (vários workers na mesma máquina)
+#   redis://host/0  -> contador no Redis (vários servidores; precisa do pacote "redis")
+
+class CanalLocal:
+    """Versões guardadas na memória do processo"""
+
+    def __init__(self):
+        self._versoes = {}
+        self._lock = threading.Lock()
+
+    def versao(self, escopo: str):
+        return self._versoes.get(escopo)
+
+    def publicar(self, escopo: str):
+        with self._lock:
+            self._versoes[escopo] = self._versoes.get(escopo, 0) + 1
+            return self._versoes[escopo]
+
+class CanalArquivo:
+    """Um arquivo por escopo com um token aleatório, trocado a cada publicação"""
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, escopo: str) -> str:
+        return os.path.join(self.diretorio, f"{escopo}.versao")
+
+    def versao(self, escopo: str):
+        try:
+            with open(self._caminho(escopo), "r", encoding="utf-8") as arquivo:
+                return arquivo.read()
+        except FileNotFoundError:
+            return None
+
+    def publicar(self, escopo: str):
+        # Token novo a cada publicação: duas escritas simultâneas nunca
+        # deixam o arquivo com um valor que algum worker já tenha visto
+        token = uuid.uuid4().hex
+        temporario = f"{self._caminho(escopo)}.{token}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            arquivo.write(token)
+        os.replace(temporario, self._caminho(escopo))  # troca atômica
+        return token
+
+class CanalRedis:
+    """Contador por escopo no Redis (INCR é atômico entre servidores)"""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_INVALIDACAO usa Redis, mas o pacote 'redis' não está instalado")
+        self._redis = redis.Redis.from_url(url)
+
+    def _chave(self, escopo: str) -> str:
+        return f"cache:versao:{escopo}"
+
+    def versao(self, escopo: str):
+        valor = self._redis.get(self._chave(escopo))
+        return int(valor) if valor is not None else None
+
+    def publicar(self, escopo: str):
+        return self._redis.incr(self._chave(escopo))
+
+def criar_canal():
+    """Cria o canal configurado em CACHE_INVALIDACAO"""
+    tipo = os.getenv("CACHE_INVALIDACAO", "local")
+
+    if tipo == "arquivo":
+        diretorio = os.getenv(
+            "CACHE_INVALIDACAO_DIR",
+            os.path.join(tempfile.gettempdir(), "ecommerce_cache")
+        )
+        return CanalArquivo(diretorio)
+
+    if tipo.startswith("redis://") or tipo.startswith("rediss://"):
+        return CanalRedis(tipo)
+
+    return CanalLocal()
+
+# Intervalo mínimo (segundos) entre consultas ao canal por cada cache.
+# 0 = consulta a cada leitura; com Redis vale usar algo como 0.5
+INTERVALO_VERIFICACAO = float(os.getenv("CACHE_INVALIDACAO_INTERVALO", "0"))
+
+canal = criar_canal()
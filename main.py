@@ -4,28 +4,30 @@ Data: 08/10/2025
 RA: 24271585
 '''
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.staticfiles import StaticFiles
 from controllers.produtos_controller import router as produtos_router
 from controllers.usuario_controller import router as usuario_router  # JWT
 from controllers.carrinho_controller import router as carrinho_router
-from database import engine, Base
+from database import engine, Base, get_db, metricas_pool, DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME
 from sqlalchemy import create_engine, text
-from urllib.parse import quote_plus
+from sqlalchemy.orm import Session
 import models
 from controllers.categorias_controller import router as categorias_router
 from controllers.checkout_controller import router as checkout_router  
 from controllers.dashboard_controller import router as dashboard_router
 from controllers.frete_controller import router as frete_router  # ✅ NOVO: IMPORT DO FRETE
+from estoque import varrer_reservas_expiradas
+from idempotencia import varrer_chaves_expiradas
+from outbox import processar_outbox, estatisticas_outbox
+from viacep import fechar_cliente as fechar_cliente_viacep
+from auth import encerrar_pool_senhas
+import asyncio
 
 # =========================
 # CONFIGURAÇÃO DO BANCO
 # =========================
-DB_USER = "root"
-DB_PASS = quote_plus("dev1t@24")  # codifica o @ corretamente
-DB_HOST = "localhost"
-DB_PORT = "3306"
-DB_NAME = "banco"
+# Credenciais vêm de database.py (variáveis de ambiente DB_*)
 
 # Conexão temporária (sem banco definido) para garantir que o DB exista
 try:
@@ -33,6 +35,7 @@ try:
     with temp_engine.connect() as conn:
         conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}"))
         print("✅ Banco de dados verificado/criado com sucesso.")
+    temp_engine.dispose()
 except Exception as e:
     print(f"❌ Erro ao verificar/criar o banco de dados: {e}")
 
@@ -65,9 +68,44 @@ app.include_router(checkout_router)
 app.include_router(dashboard_router)
 app.include_router(frete_router)  # ✅ NOVO: SISTEMA DE FRETE
 
+# =========================
+# TAREFAS EM SEGUNDO PLANO
+# =========================
+@app.on_event("startup")
+async def iniciar_tarefas():
+    # Remove periodicamente as reservas de estoque vencidas
+    asyncio.create_task(varrer_reservas_expiradas())
+    # Remove periodicamente as chaves de idempotência vencidas
+    asyncio.create_task(varrer_chaves_expiradas())
+    # Entrega os eventos do outbox (trabalho pós-pedido) fora das requisições
+    asyncio.create_task(processar_outbox())
+
+@app.on_event("shutdown")
+async def encerrar_tarefas():
+    # Fecha as conexões keep-alive do cliente do ViaCEP
+    await fechar_cliente_viacep()
+    # Encerra os processos de hash de senha
+    encerrar_pool_senhas()
+
 # =========================
 # ROTA RAIZ
 # =========================
 @app.get("/")
 def root():
-    return {"status": "Servidor rodando corretamente 🚀"}
\ No newline at end of file
+    return {"status": "Servidor rodando corretamente 🚀"}
+
+# =========================
+# MONITORAMENTO DO POOL DE CONEXÕES
+# =========================
+@app.get("/api/banco/pool")
+def status_pool():
+    """Conexões em uso/livres, tempo de espera por conexão e esgotamentos do pool"""
+    return metricas_pool()
+
+# =========================
+# MONITORAMENTO DO OUTBOX
+# =========================
+@app.get("/api/outbox")
+def status_outbox(db: Session = Depends(get_db)):
+    """Eventos pendentes/processados/que falharam e atraso do pendente mais antigo"""
+    return estatisticas_outbox(db)
@@ -0,0 +1,201 @@
+# migracoes.py
+# Migrações versionadas do esquema. Cada versão aplicada fica registrada na
+# tabela schema_migracoes e não roda de novo. As migrações conferem o que já
+# existe (colunas/índices), então um banco criado do zero pelo create_all
+# apenas registra as versões.
+#
+# Uso: python migracoes.py             aplica as migrações pendentes
+#      python migracoes.py --status    lista aplicadas/pendentes
+#      python migracoes.py --verificar EXPLAIN das consultas quentes; sai com
+#                                      erro se alguma varre a tabela inteira
+import sys
+from datetime import datetime
+from sqlalchemy import text, inspect
+from sqlalchemy.orm import Session
+from database import engine
+
+# =========================
+# AUXILIARES
+# =========================
+def _colunas(conexao, tabela: str) -> set:
+    return {coluna["name"] for coluna in inspect(conexao).get_columns(tabela)}
+
+def _indices(conexao, tabela: str) -> set:
+    return {indice["name"] for indice in inspect(conexao).get_indexes(tabela)}
+
+def _adicionar_coluna(conexao, tabela: str, coluna: str, definicao: str) -> bool:
+    if coluna in _colunas(conexao, tabela):
+        return False
+    print(f"🔄 Adicionando coluna {tabela}.{coluna}...")
+    conexao.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}"))
+    return True
+
+def _criar_indice(conexao, nome: str, tabela: str, colunas: list):
+    if not inspect(conexao).has_table(tabela):
+        # Tabela ainda não criada (ex.: banco antigo sem variações): o
+        # create_all do startup a cria já com o índice (__table_args__)
+        print(f"⚠️ Tabela {tabela} não existe; índice {nome} ignorado")
+        return
+    if nome in _indices(conexao, tabela):
+        return
+    print(f"🔄 Criando índice {nome} em {tabela}({', '.join(colunas)})...")
+    sql = f"CREATE INDEX {nome} ON {tabela} ({', '.join(colunas)})"
+    if conexao.dialect.name == "mysql":
+        # DDL online do InnoDB: a tabela continua aceitando leituras e escritas
+        sql += " ALGORITHM=INPLACE LOCK=NONE"
+    conexao.execute(text(sql))
+
+# =========================
+# MIGRAÇÕES
+# =========================
+def _001_frete(conexao):
+    _adicionar_coluna(conexao, "pedidos", "valor_frete", "DECIMAL(10,2) DEFAULT 0.00")
+    _adicionar_coluna(conexao, "pedidos", "cep_entrega", "VARCHAR(10)")
+
+def _002_total_itens(conexao):
+    if _adicionar_coluna(conexao, "pedidos", "total_itens", "INT DEFAULT 0"):
+        print("🔄 Preenchendo total_itens dos pedidos existentes...")
+        conexao.execute(text("""
+            UPDATE pedidos
+            SET total_itens = (
+                SELECT COALESCE(SUM(itens_pedido.quantidade), 0)
+                FROM itens_pedido
+                WHERE itens_pedido.pedido_id = pedidos.id
+            )
+        """))
+
+# Os mesmos índices estão declarados nos models (__table_args__)
+INDICES = [
+    ("ix_pedidos_usuario_status", "pedidos", ["usuario_id", "status"]),
+    ("ix_itens_pedido_pedido_produto", "itens_pedido", ["pedido_id", "produto_id"]),
+    ("ix_produtos_categoria", "produtos", ["categoria_id"]),
+    ("ix_produtos_nome_cor_tamanho", "produtos", ["nome", "cor", "tamanho"]),
+    ("ix_variacoes_produto_produto", "variacoes_produto", ["produto_id"]),
+]
+
+def _003_indices(conexao):
+    for nome, tabela, colunas in INDICES:
+        _criar_indice(conexao, nome, tabela, colunas)
+
+def _004_estatisticas_usuarios(conexao):
+    from models import EstatisticasUsuario
+    from pedidos import reconstruir_estatisticas
+    EstatisticasUsuario.__table__.create(bind=conexao, checkfirst=True)
+    print("🔄 Preenchendo estatisticas_usuarios a partir dos pedidos...")
+    reconstruir_estatisticas(Session(bind=conexao))
+
+def _005_indice_historico(conexao):
+    # Histórico paginado por cursor: WHERE usuario_id = ? ORDER BY data_pedido DESC, id DESC
+    _criar_indice(conexao, "ix_pedidos_usuario_data", "pedidos", ["usuario_id", "data_pedido"])
+
+def _006_chaves_idempotencia(conexao):
+    from models import ChaveIdempotencia
+    ChaveIdempotencia.__table__.create(bind=conexao, checkfirst=True)
+
+def _007_eventos_outbox(conexao):
+    from models import EventoOutbox
+    EventoOutbox.__table__.create(bind=conexao, checkfirst=True)
+
+MIGRACOES = [
+    ("001", "Colunas de frete em pedidos", _001_frete),
+    ("002", "Coluna total_itens em pedidos", _002_total_itens),
+    ("003", "Índices das consultas quentes", _003_indices),
+    ("004", "Estatísticas de pedidos por usuário", _004_estatisticas_usuarios),
+    ("005", "Índice do histórico de pedidos", _005_indice_historico),
+    ("006", "Chaves de idempotência da finalização", _006_chaves_idempotencia),
+    ("007", "Outbox de eventos de pedidos", _007_eventos_outbox),
+]
+
+# =========================
+# CONTROLE DE VERSÕES
+# =========================
+def _garantir_tabela_versoes(conexao):
+    conexao.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao VARCHAR(20) PRIMARY KEY,
+            descricao VARCHAR(200) NOT NULL,
+            aplicada_em DATETIME NOT NULL
+        )
+    """))
+
+def versoes_aplicadas() -> set:
+    with engine.begin() as conexao:
+        _garantir_tabela_versoes(conexao)
+        return {linha[0] for linha in conexao.execute(text("SELECT versao FROM schema_migracoes"))}
+
+def aplicar_migracoes():
+    aplicadas = versoes_aplicadas()
+    pendentes = [m for m in MIGRACOES if m[0] not in aplicadas]
+    if not pendentes:
+        print("✅ Nenhuma migração pendente.")
+        return
+
+    for versao, descricao, migracao in pendentes:
+        print(f"🔄 Aplicando {versao} - {descricao}...")
+        # Uma transação por versão: se falhar, a versão não é registrada
+        with engine.begin() as conexao:
+            migracao(conexao)
+            conexao.execute(
+                text("INSERT INTO schema_migracoes (versao, descricao, aplicada_em) VALUES (:v, :d, :a)"),
+                {"v": versao, "d": descricao, "a": datetime.utcnow()}
+            )
+        print(f"✅ {versao} aplicada.")
+
+def mostrar_status():
+    aplicadas = versoes_aplicadas()
+    for versao, descricao, _ in MIGRACOES:
+        marca = "✅" if versao in aplicadas else "⏳"
+        print(f"{marca} {versao} - {descricao}")
+
+# =========================
+# VERIFICAÇÃO DOS PLANOS (EXPLAIN)
+# =========================
+CONSULTAS_QUENTES = [
+    ("carrinho do usuário",
+     "SELECT id FROM pedidos WHERE usuario_id = 1 AND status = 'Em andamento'"),
+    ("histórico do usuário",
+     "SELECT id FROM pedidos WHERE usuario_id = 1 AND data_pedido < '2100-01-01' ORDER BY data_pedido DESC, id DESC"),
+    ("item do carrinho",
+     "SELECT id FROM itens_pedido WHERE pedido_id = 1 AND produto_id = 1"),
+    ("produtos da categoria",
+     "SELECT id FROM produtos WHERE categoria_id = 1"),
+    ("busca por nome/cor/tamanho",
+     "SELECT id FROM produtos WHERE nome = 'x' AND cor = 'x' AND tamanho = 'x'"),
+    ("variações do produto",
+     "SELECT id FROM variacoes_produto WHERE produto_id = 1"),
+    ("eventos pendentes do outbox",
+     "SELECT id FROM eventos_outbox WHERE status = 'pendente' AND proxima_tentativa <= '2100-01-01' ORDER BY id"),
+    ("reservas ativas do produto",
+     "SELECT quantidade FROM reservas_estoque WHERE produto_id = 1 AND expira_em > '2000-01-01'"),
+]
+
+def _varredura_completa(conexao, sql: str) -> bool:
+    """True se o plano lê a tabela inteira sem nenhum índice utilizável"""
+    if conexao.dialect.name == "mysql":
+        plano = conexao.execute(text(f"EXPLAIN {sql}")).mappings().all()
+        # type=ALL com possible_keys vazio: não existe índice para o filtro
+        # (em tabela pequena o MySQL pode preferir ALL mesmo tendo índice)
+        return any(linha["type"] == "ALL" and not linha["possible_keys"] for linha in plano)
+    if conexao.dialect.name == "sqlite":
+        plano = conexao.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return any(linha[-1].startswith("SCAN") for linha in plano)
+    raise RuntimeError(f"Verificação não suportada para o banco {conexao.dialect.name}")
+
+def verificar_planos() -> bool:
+    ok = True
+    with engine.connect() as conexao:
+        for nome, sql in CONSULTAS_QUENTES:
+            if _varredura_completa(conexao, sql):
+                ok = False
+                print(f"❌ {nome}: varredura completa da tabela\n   {sql}")
+            else:
+                print(f"✅ {nome}: usa índice")
+    return ok
+
+if __name__ == "__main__":
+    if "--status" in sys.argv:
+        mostrar_status()
+    elif "--verificar" in sys.argv:
+        sys.exit(0 if verificar_planos() else 1)
+    else:
+        aplicar_migracoes()
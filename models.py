@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, DECIMAL, ForeignKey, Text, DateTime, Float
+from sqlalchemy import Column, Integer, String, DECIMAL, ForeignKey, Text, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -27,6 +27,12 @@ class Produto(Base):
 
     itens = relationship("ItemPedido", back_populates="produto")
 
+    # Índices criados em bancos existentes pela migração 003 (migracoes.py)
+    __table_args__ = (
+        Index("ix_produtos_categoria", "categoria_id"),
+        Index("ix_produtos_nome_cor_tamanho", "nome", "cor", "tamanho"),
+    )
+
 class Usuario(Base):
     __tablename__ = "usuarios"
     id = Column(Integer, primary_key=True, index=True)
@@ -47,9 +53,15 @@ class Pedido(Base):
     # ✅ NOVO CAMPO: Valor do frete
     valor_frete = Column(DECIMAL(10, 2), default=0.00)
     cep_entrega = Column(String(10))  # ✅ NOVO: CEP de entrega
+    total_itens = Column(Integer, default=0)  # soma das quantidades dos itens (mantida por delta)
     usuario = relationship("Usuario", back_populates="pedidos")
     itens = relationship("ItemPedido", back_populates="pedido")
 
+    __table_args__ = (
+        Index("ix_pedidos_usuario_status", "usuario_id", "status"),
+        Index("ix_pedidos_usuario_data", "usuario_id", "data_pedido"),
+    )
+
 class ItemPedido(Base):
     __tablename__ = "itens_pedido"
     id = Column(Integer, primary_key=True, index=True)
@@ -61,6 +73,10 @@ class ItemPedido(Base):
     
     produto = relationship("Produto", back_populates="itens")
 
+    __table_args__ = (
+        Index("ix_itens_pedido_pedido_produto", "pedido_id", "produto_id"),
+    )
+
 class VariacaoProduto(Base):
     __tablename__ = "variacoes_produto"
     id = Column(Integer, primary_key=True, index=True)
@@ -69,4 +85,64 @@ class VariacaoProduto(Base):
     tamanho = Column(String(10), nullable=False)
     quantidade = Column(Integer, nullable=False)
     imagem = Column(String(200), nullable=True)
-    produto = relationship("Produto")
\ No newline at end of file
+    produto = relationship("Produto")
+
+    __table_args__ = (
+        Index("ix_variacoes_produto_produto", "produto_id"),
+    )
+
+class ReservaEstoque(Base):
+    """Unidades seguradas por um item de carrinho até 'expira_em'"""
+    __tablename__ = "reservas_estoque"
+    id = Column(Integer, primary_key=True, index=True)
+    item_pedido_id = Column(Integer, ForeignKey("itens_pedido.id"), nullable=False, unique=True)
+    pedido_id = Column(Integer, ForeignKey("pedidos.id"), nullable=False)
+    produto_id = Column(Integer, ForeignKey("produtos.id"), nullable=False)
+    quantidade = Column(Integer, nullable=False)
+    expira_em = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_reservas_produto_expira", "produto_id", "expira_em"),
+    )
+
+class EstatisticasUsuario(Base):
+    """Totais de pedidos do usuário mantidos por delta (ver estatisticas.py)"""
+    __tablename__ = "estatisticas_usuarios"
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), primary_key=True)
+    total_pedidos = Column(Integer, nullable=False, default=0)
+    pedidos_ativos = Column(Integer, nullable=False, default=0)
+    total_gasto = Column(DECIMAL(12, 2), nullable=False, default=0.00)  # produtos + frete
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChaveIdempotencia(Base):
+    """Resposta de uma finalização guardada pela Idempotency-Key (ver idempotencia.py)"""
+    __tablename__ = "chaves_idempotencia"
+    escopo = Column(String(100), primary_key=True)  # endpoint + usuário
+    chave = Column(String(255), primary_key=True)
+    impressao = Column(String(64), nullable=False)  # sha256 do corpo da requisição
+    status_code = Column(Integer)                   # NULL enquanto a requisição original roda
+    resposta = Column(Text)                         # corpo JSON da resposta original
+    expira_em = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_chaves_idempotencia_expira", "expira_em"),
+    )
+
+class EventoOutbox(Base):
+    """Trabalho pós-pedido gravado junto com a mudança do pedido (ver outbox.py)"""
+    __tablename__ = "eventos_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False)             # ex.: pedido_finalizado
+    pedido_id = Column(Integer, ForeignKey("pedidos.id"))
+    dados = Column(Text, nullable=False)                  # JSON entregue aos manipuladores
+    status = Column(String(20), nullable=False, default="pendente")  # pendente, processando, processado, falhou
+    tentativas = Column(Integer, nullable=False, default=0)
+    # Pendente: quando tentar de novo. Processando: prazo da reivindicação
+    proxima_tentativa = Column(DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_erro = Column(Text)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    processado_em = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_eventos_outbox_status_proxima", "status", "proxima_tentativa"),
+    )
@@ -0,0 +1,227 @@
+# outbox.py
+# Outbox transacional: o trabalho que vem depois de um pedido (e-mail, nota
+# fiscal, integração com ERP...) não roda dentro da requisição. A rota grava
+# um evento em eventos_outbox na MESMA transação da mudança do pedido, e a
+# tarefa de fundo processar_outbox() entrega os eventos aos manipuladores,
+# com novas tentativas e espera crescente (backoff) em caso de erro.
+#
+# Se o pedido não for confirmado o evento também não existe; se for, o
+# evento será processado mesmo que o servidor caia logo depois. A entrega é
+# "pelo menos uma vez": um manipulador pode rodar de novo para o mesmo
+# evento (ex.: outro manipulador do mesmo tipo falhou), então precisa
+# tolerar repetição.
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import EventoOutbox, Pedido
+
+OUTBOX_INTERVALO_SEGUNDOS = float(os.getenv("OUTBOX_INTERVALO_SEGUNDOS", "1"))
+OUTBOX_LOTE = int(os.getenv("OUTBOX_LOTE", "50"))
+OUTBOX_MAX_TENTATIVAS = int(os.getenv("OUTBOX_MAX_TENTATIVAS", "8"))
+OUTBOX_BACKOFF_SEGUNDOS = float(os.getenv("OUTBOX_BACKOFF_SEGUNDOS", "2"))
+OUTBOX_BACKOFF_MAXIMO = float(os.getenv("OUTBOX_BACKOFF_MAXIMO", "600"))
+OUTBOX_RETENCAO_DIAS = int(os.getenv("OUTBOX_RETENCAO_DIAS", "7"))
+
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+PROCESSADO = "processado"
+FALHOU = "falhou"
+
+# =========================
+# MANIPULADORES
+# =========================
+# tipo do evento -> funções que recebem os dados (dict). Rodam numa thread
+# do worker, fora de qualquer requisição.
+MANIPULADORES = {}
+
+def ao_evento(tipo: str):
+    """Decorador que registra um manipulador para o tipo de evento"""
+    def registrar(funcao):
+        MANIPULADORES.setdefault(tipo, []).append(funcao)
+        return funcao
+    return registrar
+
+@ao_evento("pedido_finalizado")
+@ao_evento("pedido_cancelado")
+def _registrar_no_log(dados: dict):
+    # Ponto de partida; e-mail, nota fiscal e ERP entram como novos manipuladores
+    print(f"📦 Pedido #{dados['pedido_id']} {dados['status']} (usuário {dados['usuario_id']})")
+
+# =========================
+# GRAVAÇÃO (DENTRO DA TRANSAÇÃO DO PEDIDO)
+# =========================
+def registrar_evento(db: Session, tipo: str, pedido: Pedido, dados: dict = None):
+    """Chamar antes do db.commit() da rota que mudou o pedido"""
+    dados = {
+        "pedido_id": pedido.id,
+        "usuario_id": pedido.usuario_id,
+        "status": pedido.status,
+        **(dados or {})
+    }
+    db.add(EventoOutbox(tipo=tipo, pedido_id=pedido.id, dados=json.dumps(dados, default=str)))
+
+# =========================
+# PROCESSAMENTO
+# =========================
+# Três passos, nenhum segurando transação durante o trabalho externo:
+#   1. reivindicar_lote(): transação curta que marca o lote como
+#      'processando' com prazo (OUTBOX_PRAZO_SEGUNDOS). Se o worker cair,
+#      o evento volta a ser elegível quando o prazo vence.
+#   2. os manipuladores rodam sem transação aberta, cada evento com no
+#      máximo OUTBOX_TIMEOUT_SEGUNDOS.
+#   3. registrar_resultado(): uma transação curta por evento.
+OUTBOX_TIMEOUT_SEGUNDOS = float(os.getenv("OUTBOX_TIMEOUT_SEGUNDOS", "30"))
+OUTBOX_PRAZO_SEGUNDOS = float(os.getenv("OUTBOX_PRAZO_SEGUNDOS", "120"))  # maior que o timeout
+OUTBOX_THREADS = int(os.getenv("OUTBOX_THREADS", "8"))
+
+# Threads só dos manipuladores: um manipulador travado ocupa uma delas, não
+# as do threadpool das rotas nem as do asyncio.to_thread
+_executor_manipuladores = ThreadPoolExecutor(max_workers=OUTBOX_THREADS, thread_name_prefix="outbox")
+
+def _espera_backoff(tentativas: int) -> float:
+    """2s, 4s, 8s... até OUTBOX_BACKOFF_MAXIMO, com variação para não sincronizar retentativas"""
+    espera = min(OUTBOX_BACKOFF_SEGUNDOS * 2 ** (tentativas - 1), OUTBOX_BACKOFF_MAXIMO)
+    return espera * random.uniform(0.8, 1.2)
+
+def reivindicar_lote(db: Session) -> list:
+    """
+    Marca até OUTBOX_LOTE eventos vencidos como 'processando' e confirma.
+    Em 'processando', proxima_tentativa guarda o prazo da reivindicação.
+    SKIP LOCKED: com vários workers do app, cada evento é pego por um só.
+    """
+    agora = datetime.utcnow()
+    eventos = db.query(EventoOutbox).filter(
+        EventoOutbox.status.in_([PENDENTE, PROCESSANDO]),
+        EventoOutbox.proxima_tentativa <= agora
+    ).order_by(EventoOutbox.id).limit(OUTBOX_LOTE).with_for_update(skip_locked=True).all()
+
+    reivindicados = []
+    for evento in eventos:
+        evento.status = PROCESSANDO
+        evento.tentativas += 1
+        evento.proxima_tentativa = agora + timedelta(seconds=OUTBOX_PRAZO_SEGUNDOS)
+        reivindicados.append({
+            "id": evento.id,
+            "tipo": evento.tipo,
+            "dados": evento.dados,
+            "tentativas": evento.tentativas
+        })
+    db.commit()
+    return reivindicados
+
+def _entregar(tipo: str, dados: str):
+    manipuladores = MANIPULADORES.get(tipo)
+    if not manipuladores:
+        raise LookupError(f"Nenhum manipulador para o evento '{tipo}'")
+    dados = json.loads(dados)
+    for manipulador in manipuladores:
+        manipulador(dados)
+
+def registrar_resultado(db: Session, evento: dict, erro: str = None):
+    """
+    Grava o resultado de um evento reivindicado. Só altera a linha se ela
+    ainda é desta reivindicação (o prazo pode ter vencido e outro worker
+    ter pego o evento).
+    """
+    if erro is None:
+        valores = {
+            EventoOutbox.status: PROCESSADO,
+            EventoOutbox.processado_em: datetime.utcnow(),
+            EventoOutbox.ultimo_erro: None
+        }
+    elif evento["tentativas"] >= OUTBOX_MAX_TENTATIVAS:
+        valores = {EventoOutbox.status: FALHOU, EventoOutbox.ultimo_erro: erro}
+        print(f"❌ Evento {evento['id']} ({evento['tipo']}) desistido após {evento['tentativas']} tentativas: {erro}")
+    else:
+        valores = {
+            EventoOutbox.status: PENDENTE,
+            EventoOutbox.ultimo_erro: erro,
+            EventoOutbox.proxima_tentativa: datetime.utcnow() + timedelta(seconds=_espera_backoff(evento["tentativas"]))
+        }
+    db.query(EventoOutbox).filter(
+        EventoOutbox.id == evento["id"],
+        EventoOutbox.status == PROCESSANDO,
+        EventoOutbox.tentativas == evento["tentativas"]
+    ).update(valores, synchronize_session=False)
+    db.commit()
+
+def _em_sessao(funcao, *args):
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        return funcao(db, *args)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def _processar_evento(evento: dict, vagas: asyncio.Semaphore):
+    loop = asyncio.get_running_loop()
+    erro = None
+    try:
+        # O timeout só começa a contar quando há thread livre para o manipulador
+        async with vagas:
+            await asyncio.wait_for(
+                loop.run_in_executor(_executor_manipuladores, _entregar, evento["tipo"], evento["dados"]),
+                OUTBOX_TIMEOUT_SEGUNDOS
+            )
+    except asyncio.TimeoutError:
+        # A thread do manipulador não tem como ser interrompida; o evento
+        # volta para a fila e pode rodar de novo (entrega "pelo menos uma vez")
+        erro = f"TimeoutError: manipulador passou de {OUTBOX_TIMEOUT_SEGUNDOS:g}s"
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    await asyncio.to_thread(_em_sessao, registrar_resultado, evento, erro)
+
+async def processar_lote() -> int:
+    """Reivindica um lote, entrega os eventos em paralelo e grava cada resultado"""
+    eventos = await asyncio.to_thread(_em_sessao, reivindicar_lote)
+    vagas = asyncio.Semaphore(OUTBOX_THREADS)
+    await asyncio.gather(*(_processar_evento(evento, vagas) for evento in eventos))
+    return len(eventos)
+
+def remover_eventos_processados(db: Session) -> int:
+    """Apaga eventos processados há mais de OUTBOX_RETENCAO_DIAS (os que falharam ficam para análise)"""
+    removidos = db.query(EventoOutbox).filter(
+        EventoOutbox.status == PROCESSADO,
+        EventoOutbox.processado_em < datetime.utcnow() - timedelta(days=OUTBOX_RETENCAO_DIAS)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removidos
+
+def estatisticas_outbox(db: Session) -> dict:
+    """Quantidade de eventos por status e idade do pendente mais antigo"""
+    contagem = dict(db.query(EventoOutbox.status, func.count(EventoOutbox.id)).group_by(EventoOutbox.status).all())
+    mais_antigo = db.query(func.min(EventoOutbox.criado_em)).filter(EventoOutbox.status == PENDENTE).scalar()
+    return {
+        PENDENTE: contagem.get(PENDENTE, 0),
+        PROCESSANDO: contagem.get(PROCESSANDO, 0),
+        PROCESSADO: contagem.get(PROCESSADO, 0),
+        FALHOU: contagem.get(FALHOU, 0),
+        "pendente_mais_antigo_segundos": round((datetime.utcnow() - mais_antigo).total_seconds(), 1) if mais_antigo else 0.0
+    }
+
+async def processar_outbox():
+    """Tarefa de fundo (iniciada no startup do app) que drena o outbox"""
+    ultima_limpeza = time.monotonic()
+    while True:
+        try:
+            if time.monotonic() - ultima_limpeza > 3600:
+                ultima_limpeza = time.monotonic()
+                removidos = await asyncio.to_thread(_em_sessao, remover_eventos_processados)
+                if removidos:
+                    print(f"🧹 {removidos} evento(s) processado(s) do outbox removido(s)")
+            processados = await processar_lote()
+        except Exception as e:
+            print(f"❌ Erro ao processar o outbox: {e}")
+            processados = 0
+        # Lote cheio: provavelmente há mais eventos esperando, segue sem dormir
+        if processados < OUTBOX_LOTE:
+            await asyncio.sleep(OUTBOX_INTERVALO_SEGUNDOS)
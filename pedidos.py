@@ -0,0 +1,229 @@
+# pedidos.py
+import os
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, case, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, object_session
+from models import Pedido, ItemPedido, Produto, EstatisticasUsuario
+
+# Status usado para o carrinho aberto do usuário
+STATUS_CARRINHO = "Em andamento"
+
+# Status contados como "pedidos ativos" no dashboard
+STATUS_ATIVOS = ["Em andamento", "Processando"]
+
+PEDIDOS_POR_PAGINA = int(os.getenv("DASHBOARD_PEDIDOS_POR_PAGINA", "5"))
+HISTORICO_POR_PAGINA = int(os.getenv("HISTORICO_PEDIDOS_POR_PAGINA", "20"))
+
+def carregar_carrinho(db: Session, usuario_id: int):
+    """
+    Retorna o pedido em andamento do usuário já com os itens e os produtos
+    carregados em UMA consulta (JOIN), ou None se não houver carrinho.
+    """
+    return db.query(Pedido).options(
+        joinedload(Pedido.itens).joinedload(ItemPedido.produto)
+    ).filter(
+        Pedido.usuario_id == usuario_id,
+        Pedido.status == STATUS_CARRINHO
+    ).first()
+
+def aplicar_delta_carrinho(pedido: Pedido, delta_valor: float, delta_itens: int):
+    """
+    Atualiza valor_total e total_itens do pedido pela diferença, sem
+    recarregar os itens. A soma é feita pelo próprio banco no UPDATE
+    (valor_total = valor_total + delta), então cliques rápidos em
+    requisições simultâneas não se sobrescrevem.
+    O pedido precisa já existir no banco (use db.flush() ao criar).
+    """
+    pedido.valor_total = func.coalesce(Pedido.valor_total, 0) + delta_valor
+    pedido.total_itens = func.coalesce(Pedido.total_itens, 0) + delta_itens
+    ajustar_estatisticas(object_session(pedido), pedido.usuario_id, gasto=delta_valor)
+
+def aplicar_delta_item(item: ItemPedido, delta_quantidade: int, delta_subtotal: float):
+    """
+    Soma quantidade e subtotal na linha do carrinho pelo próprio banco
+    (quantidade = quantidade + n), como aplicar_delta_carrinho faz no pedido:
+    dois cliques simultâneos no mesmo item somam os dois, e a linha continua
+    batendo com valor_total/total_itens do pedido.
+    """
+    item.quantidade = ItemPedido.quantidade + delta_quantidade
+    item.subtotal = ItemPedido.subtotal + delta_subtotal
+    object_session(item).flush()  # item.quantidade volta a ser o valor gravado
+
+def estatisticas_pedidos(db: Session, usuario_id: int) -> dict:
+    """
+    total_pedidos, pedidos_ativos e total_gasto (produtos + frete) do
+    usuário calculados pelo banco em UMA consulta agregada
+    """
+    total_pedidos, pedidos_ativos, total_gasto = db.query(
+        func.count(Pedido.id),
+        func.coalesce(func.sum(case((Pedido.status.in_(STATUS_ATIVOS), 1), else_=0)), 0),
+        func.coalesce(func.sum(
+            func.coalesce(Pedido.valor_total, 0) + func.coalesce(Pedido.valor_frete, 0)
+        ), 0)
+    ).filter(Pedido.usuario_id == usuario_id).one()
+
+    return {
+        "total_pedidos": total_pedidos,
+        "pedidos_ativos": int(pedidos_ativos),
+        "total_gasto": float(total_gasto)
+    }
+
+def carregar_pagina_pedidos(db: Session, usuario_id: int, pagina: int = 1, por_pagina: int = PEDIDOS_POR_PAGINA):
+    """
+    Pedidos do usuário (mais recentes primeiro) de uma página, já com itens
+    e produtos carregados em UMA consulta
+    """
+    return db.query(Pedido).options(
+        joinedload(Pedido.itens).joinedload(ItemPedido.produto)
+    ).filter(
+        Pedido.usuario_id == usuario_id
+    ).order_by(
+        Pedido.data_pedido.desc(), Pedido.id.desc()
+    ).limit(por_pagina).offset((pagina - 1) * por_pagina).all()
+
+# =========================
+# HISTÓRICO (PAGINAÇÃO POR CURSOR)
+# =========================
+# O cursor é a posição do último pedido da página, "data_pedido|id": a
+# próxima página começa logo depois dele no índice (usuario_id, data_pedido),
+# então a página 100 custa o mesmo que a primeira (sem OFFSET).
+
+def criar_cursor(pedido: Pedido) -> str:
+    return f"{pedido.data_pedido.isoformat()}|{pedido.id}"
+
+def ler_cursor(cursor: str):
+    """(data_pedido, id) do cursor; ValueError se estiver malformado"""
+    data, pedido_id = cursor.rsplit("|", 1)
+    return datetime.fromisoformat(data), int(pedido_id)
+
+def carregar_historico(
+    db: Session,
+    usuario_id: int,
+    cursor: str = None,
+    de: date = None,
+    ate: date = None,
+    por_pagina: int = HISTORICO_POR_PAGINA
+):
+    """
+    Uma página do histórico (mais recentes primeiro) em UMA consulta
+    agrupada: cada linha traz o pedido, a quantidade de itens e os nomes dos
+    produtos. 'de' e 'ate' filtram pela data do pedido (dias inclusivos).
+    Retorna (linhas, cursor da próxima página ou None).
+    """
+    consulta = db.query(
+        Pedido,
+        func.count(ItemPedido.id).label("quantidade_itens"),
+        func.aggregate_strings(Produto.nome, ", ").label("produtos")
+    ).outerjoin(
+        ItemPedido, ItemPedido.pedido_id == Pedido.id
+    ).outerjoin(
+        Produto, Produto.id == ItemPedido.produto_id
+    ).filter(Pedido.usuario_id == usuario_id)
+
+    if de:
+        consulta = consulta.filter(Pedido.data_pedido >= datetime.combine(de, time.min))
+    if ate:
+        consulta = consulta.filter(Pedido.data_pedido < datetime.combine(ate + timedelta(days=1), time.min))
+    if cursor:
+        data_cursor, id_cursor = ler_cursor(cursor)
+        consulta = consulta.filter(or_(
+            Pedido.data_pedido < data_cursor,
+            and_(Pedido.data_pedido == data_cursor, Pedido.id < id_cursor)
+        ))
+
+    # Uma linha a mais só para saber se existe próxima página
+    linhas = consulta.group_by(Pedido.id).order_by(
+        Pedido.data_pedido.desc(), Pedido.id.desc()
+    ).limit(por_pagina + 1).all()
+
+    proximo = criar_cursor(linhas[por_pagina - 1].Pedido) if len(linhas) > por_pagina else None
+    return linhas[:por_pagina], proximo
+
+def carregar_itens_pedidos(db: Session, pedido_ids: list) -> dict:
+    """Itens com o nome do produto de vários pedidos em UMA consulta: {pedido_id: [(item, nome)]}"""
+    itens = {pedido_id: [] for pedido_id in pedido_ids}
+    if not pedido_ids:
+        return itens
+    linhas = db.query(ItemPedido, Produto.nome).outerjoin(
+        Produto, Produto.id == ItemPedido.produto_id
+    ).filter(ItemPedido.pedido_id.in_(pedido_ids)).order_by(ItemPedido.id).all()
+    for item, nome in linhas:
+        itens[item.pedido_id].append((item, nome))
+    return itens
+
+# =========================
+# ESTATÍSTICAS MATERIALIZADAS POR USUÁRIO
+# =========================
+# Mesmos números de estatisticas_pedidos(), mas guardados em
+# estatisticas_usuarios e mantidos por delta a cada mudança de pedido,
+# para o dashboard e o perfil lerem uma linha só.
+# Reconstrução completa: python estatisticas.py
+
+def _somar_deltas(db: Session, usuario_id: int, pedidos: int, ativos: int, gasto: float) -> int:
+    return db.query(EstatisticasUsuario).filter(
+        EstatisticasUsuario.usuario_id == usuario_id
+    ).update({
+        EstatisticasUsuario.total_pedidos: EstatisticasUsuario.total_pedidos + pedidos,
+        EstatisticasUsuario.pedidos_ativos: EstatisticasUsuario.pedidos_ativos + ativos,
+        EstatisticasUsuario.total_gasto: EstatisticasUsuario.total_gasto + gasto
+    }, synchronize_session=False)
+
+def ajustar_estatisticas(db: Session, usuario_id: int, pedidos: int = 0, ativos: int = 0, gasto: float = 0.0):
+    """
+    Soma os deltas na linha do usuário (UPDATE atômico, na mesma transação
+    da mudança do pedido). Se a linha ainda não existe, ela é criada a partir
+    do agregado, que já enxerga as mudanças desta transação (flush), então o
+    delta não é somado de novo.
+    """
+    if not (pedidos or ativos or gasto):
+        return
+    db.flush()
+    if _somar_deltas(db, usuario_id, pedidos, ativos, gasto):
+        return
+    try:
+        with db.begin_nested():
+            db.add(EstatisticasUsuario(usuario_id=usuario_id, **estatisticas_pedidos(db, usuario_id)))
+    except IntegrityError:
+        # Outra requisição criou a linha ao mesmo tempo (sem esta mudança)
+        _somar_deltas(db, usuario_id, pedidos, ativos, gasto)
+
+def registrar_pedido_novo(db: Session, pedido: Pedido):
+    """Chamar depois de criar um pedido (já com status e valores)"""
+    ajustar_estatisticas(
+        db, pedido.usuario_id,
+        pedidos=1,
+        ativos=int(pedido.status in STATUS_ATIVOS),
+        gasto=float(pedido.valor_total or 0) + float(pedido.valor_frete or 0)
+    )
+
+def registrar_mudanca_status(db: Session, pedido: Pedido, status_anterior: str, delta_gasto: float = 0.0):
+    """Chamar depois de mudar pedido.status (e, se for o caso, o frete)"""
+    ajustar_estatisticas(
+        db, pedido.usuario_id,
+        ativos=int(pedido.status in STATUS_ATIVOS) - int(status_anterior in STATUS_ATIVOS),
+        gasto=delta_gasto
+    )
+
+def obter_estatisticas(db: Session, usuario_id: int) -> dict:
+    """Leitura O(1) da linha materializada; sem linha, calcula pelo agregado"""
+    linha = db.get(EstatisticasUsuario, usuario_id)
+    if not linha:
+        return estatisticas_pedidos(db, usuario_id)
+    return {
+        "total_pedidos": linha.total_pedidos,
+        "pedidos_ativos": linha.pedidos_ativos,
+        "total_gasto": float(linha.total_gasto)
+    }
+
+def reconstruir_estatisticas(db: Session, usuario_id: int = None) -> int:
+    """Recalcula a linha de um usuário (ou de todos) a partir dos pedidos"""
+    if usuario_id:
+        usuarios = [usuario_id]
+    else:
+        usuarios = [linha[0] for linha in db.query(Pedido.usuario_id).distinct().all()]
+
+    for uid in usuarios:
+        db.merge(EstatisticasUsuario(usuario_id=uid, **estatisticas_pedidos(db, uid)))
+    db.commit()
+    return len(usuarios)
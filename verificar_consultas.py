@@ -0,0 +1,133 @@
+# verificar_consultas.py
+# Checagem de regressão de N+1: monta as tabelas do app num SQLite em
+# memória, cria dados de tamanhos diferentes e conta os comandos SQL
+# (evento before_cursor_execute) de cada rota quente. A contagem tem que
+# ser a mesma para 1 ou 50 itens (ou pedidos); se crescer junto com os
+# dados, alguma rota voltou a fazer uma consulta por linha.
+#
+# Uso: python verificar_consultas.py   (sai com código 1 se alguma contagem variar)
+import sys
+import uuid
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from fastapi.testclient import TestClient
+import models
+from auth import criar_token
+from database import get_db, get_db_leitura
+from pedidos import reconstruir_estatisticas
+from main import app
+
+TAMANHOS = [1, 10, 50]
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+SessaoTeste = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+consultas = []
+
+@event.listens_for(engine, "before_cursor_execute")
+def _contar(conn, cursor, statement, parameters, context, executemany):
+    consultas.append(statement)
+
+def _sessao_teste():
+    db = SessaoTeste()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _criar_usuario(db) -> models.Usuario:
+    usuario = models.Usuario(nome="Teste", email=f"{uuid.uuid4().hex[:8]}@teste.local", senha="-")
+    db.add(usuario)
+    db.flush()
+    return usuario
+
+def _criar_produtos(db, quantidade: int) -> list:
+    produtos = [
+        models.Produto(nome=f"Produto {i}", preco=10.0 + i, quantidade=100, imagem="x.png")
+        for i in range(quantidade)
+    ]
+    db.add_all(produtos)
+    db.flush()
+    return produtos
+
+def _criar_pedido(db, usuario: models.Usuario, produtos: list, status: str) -> models.Pedido:
+    pedido = models.Pedido(
+        usuario_id=usuario.id,
+        status=status,
+        valor_total=sum(produto.preco for produto in produtos),
+        total_itens=len(produtos)
+    )
+    db.add(pedido)
+    db.flush()
+    db.add_all([
+        models.ItemPedido(pedido_id=pedido.id, produto_id=produto.id, quantidade=1, subtotal=produto.preco)
+        for produto in produtos
+    ])
+    return pedido
+
+# =========================
+# CENÁRIOS (um usuário novo por tamanho; retorna o e-mail dele)
+# =========================
+def preparar_carrinho(db, tamanho: int) -> str:
+    """Carrinho em andamento com `tamanho` itens, cada um de um produto diferente"""
+    usuario = _criar_usuario(db)
+    _criar_pedido(db, usuario, _criar_produtos(db, tamanho), "Em andamento")
+    return usuario.email
+
+def preparar_pedidos(db, tamanho: int) -> str:
+    """`tamanho` pedidos (alternando ativos e finalizados) com `tamanho` itens cada"""
+    usuario = _criar_usuario(db)
+    produtos = _criar_produtos(db, tamanho)
+    for i in range(tamanho):
+        _criar_pedido(db, usuario, produtos, "Processando" if i % 2 else "Finalizado")
+    db.commit()
+    reconstruir_estatisticas(db, usuario.id)
+    return usuario.email
+
+CHECAGENS = [
+    ("Página do carrinho", "/api/carrinho/", preparar_carrinho),
+    ("Dados do carrinho (JSON)", "/api/carrinho/dados", preparar_carrinho),
+    ("Dashboard do usuário", "/dashboard", preparar_pedidos),
+    ("Histórico de pedidos", "/dashboard/pedidos", preparar_pedidos),
+]
+
+# =========================
+# CONTAGEM
+# =========================
+def contar_consultas(cliente: TestClient, caminho: str, email: str) -> int:
+    cliente.cookies.set("token", criar_token({"sub": email}))
+    cliente.get(caminho)  # aquecimento: usuário e token vão para o cache
+    consultas.clear()
+    resposta = cliente.get(caminho)
+    if resposta.status_code != 200:
+        raise RuntimeError(f"GET {caminho} respondeu {resposta.status_code}")
+    return len(consultas)
+
+def verificar_consultas() -> bool:
+    models.Base.metadata.create_all(engine)
+    app.dependency_overrides[get_db] = _sessao_teste
+    app.dependency_overrides[get_db_leitura] = _sessao_teste
+    cliente = TestClient(app)
+
+    tudo_certo = True
+    for nome, caminho, preparar in CHECAGENS:
+        contagens = []
+        for tamanho in TAMANHOS:
+            db = SessaoTeste()
+            try:
+                email = preparar(db, tamanho)
+                db.commit()
+            finally:
+                db.close()
+            contagens.append(contar_consultas(cliente, caminho, email))
+
+        detalhe = " | ".join(f"{tamanho}: {total}" for tamanho, total in zip(TAMANHOS, contagens))
+        if len(set(contagens)) == 1:
+            print(f"✅ {nome}: {contagens[0]} consulta(s) em qualquer tamanho ({detalhe})")
+        else:
+            print(f"❌ {nome}: número de consultas cresce com os dados ({detalhe})")
+            tudo_certo = False
+    return tudo_certo
+
+if __name__ == "__main__":
+    sys.exit(0 if verificar_consultas() else 1)
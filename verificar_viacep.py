@@ -0,0 +1,178 @@
+# verificar_viacep.py
+# Checagem do cliente do ViaCEP (viacep.py) contra um servidor falso local,
+# sem acessar a internet:
+#   - consultas simultâneas ao mesmo CEP viram UMA requisição (coalescência),
+#     inclusive quando essa requisição falha
+#   - respostas (e CEPs inexistentes) ficam no cache
+#   - o disjuntor abre depois de N falhas seguidas (erro 500 ou timeout),
+#     para de chamar o servidor enquanto aberto e fecha no primeiro sucesso
+#
+# Uso: python verificar_viacep.py   (sai com código 1 se alguma checagem falhar)
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import viacep
+from cache_cep import CacheCEP
+from viacep import consultar_cep, ViaCEPIndisponivel, Disjuntor
+
+FALHAS_PARA_ABRIR = 3
+SEGUNDOS_ABERTO = 0.5
+TIMEOUT = 0.3
+
+# =========================
+# SERVIDOR FALSO DO VIACEP
+# =========================
+# GET /ws/{cep}/json/ -> endereço, ou {"erro": true} para CEPs começados
+# por 99. O comportamento muda com estado["modo"]: "ok", "erro" (HTTP 500)
+# ou "lento" (passa do timeout do cliente).
+estado = {"modo": "ok", "requisicoes": 0}
+_lock = threading.Lock()
+
+class ViaCEPFalso(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with _lock:
+            estado["requisicoes"] += 1
+            modo = estado["modo"]
+        cep = self.path.strip("/").split("/")[1]
+        time.sleep(0.1)  # tempo para as consultas simultâneas se juntarem
+        if modo == "lento":
+            time.sleep(TIMEOUT * 3)
+        if modo == "erro":
+            self._responder(500, {"erro": "indisponível"})
+        elif cep.startswith("99"):
+            self._responder(200, {"erro": True})
+        else:
+            self._responder(200, {"cep": cep, "logradouro": "Rua Teste", "localidade": "Campinas", "uf": "SP"})
+
+    def _responder(self, status_code: int, corpo: dict):
+        dados = json.dumps(corpo).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # o cliente já desistiu (timeout)
+
+    def log_message(self, *args):
+        pass  # sem log por requisição
+
+# =========================
+# CHECAGENS
+# =========================
+falhas = []
+
+def _conferir(nome: str, condicao: bool, detalhe: str = ""):
+    print(f"{'✅' if condicao else '❌'} {nome}{f' ({detalhe})' if detalhe else ''}")
+    if not condicao:
+        falhas.append(nome)
+
+async def _varias(cep: str, quantidade: int) -> list:
+    """Dispara `quantidade` consultas simultâneas; exceções voltam na lista"""
+    return await asyncio.gather(*(consultar_cep(cep) for _ in range(quantidade)), return_exceptions=True)
+
+def _requisicoes_durante(antes: int) -> int:
+    return estado["requisicoes"] - antes
+
+async def checar_coalescencia():
+    antes = estado["requisicoes"]
+    resultados = await _varias("13010000", 50)
+    _conferir(
+        "50 consultas simultâneas ao mesmo CEP fazem 1 requisição",
+        _requisicoes_durante(antes) == 1 and all(r == resultados[0] for r in resultados),
+        f"{_requisicoes_durante(antes)} requisição(ões)"
+    )
+
+    antes = estado["requisicoes"]
+    dados = await consultar_cep("13010000")
+    _conferir("CEP já consultado vem do cache", _requisicoes_durante(antes) == 0 and dados == resultados[0])
+
+    await consultar_cep("99999999")
+    antes = estado["requisicoes"]
+    dados = await consultar_cep("99999999")
+    _conferir("CEP inexistente fica no cache", _requisicoes_durante(antes) == 0 and dados.get("erro") is True)
+
+async def checar_disjuntor():
+    estado["modo"] = "erro"
+    antes = estado["requisicoes"]
+    resultados = await _varias("13020000", 20)
+    _conferir(
+        "Falha com consultas simultâneas: 1 requisição, erro para todas",
+        _requisicoes_durante(antes) == 1 and all(isinstance(r, ViaCEPIndisponivel) for r in resultados),
+        f"{_requisicoes_durante(antes)} requisição(ões)"
+    )
+    _conferir("Falha não vai para o cache", viacep.cache_cep.memoria.buscar("13020000") is viacep.AUSENTE)
+
+    # Mais falhas (uma por timeout) até abrir
+    estado["modo"] = "lento"
+    for i in range(FALHAS_PARA_ABRIR - 1):
+        try:
+            await consultar_cep(f"1303000{i}")
+        except ViaCEPIndisponivel:
+            pass
+    _conferir(
+        f"Disjuntor abre após {FALHAS_PARA_ABRIR} falhas seguidas (500 e timeout)",
+        viacep.disjuntor.aberto,
+        f"{viacep.disjuntor.falhas_seguidas} falha(s)"
+    )
+
+    estado["modo"] = "ok"
+    antes = estado["requisicoes"]
+    resultados = await _varias("13040000", 10)
+    _conferir(
+        "Com o disjuntor aberto nenhuma requisição sai",
+        _requisicoes_durante(antes) == 0 and all(isinstance(r, ViaCEPIndisponivel) for r in resultados)
+    )
+
+    await asyncio.sleep(SEGUNDOS_ABERTO)
+    antes = estado["requisicoes"]
+    try:
+        dados = await consultar_cep("13040000")
+    except ViaCEPIndisponivel:
+        dados = None
+    _conferir(
+        "Passado o tempo aberto, um sucesso fecha o disjuntor",
+        dados is not None and _requisicoes_durante(antes) == 1 and not viacep.disjuntor.aberto
+        and viacep.disjuntor.falhas_seguidas == 0
+    )
+
+    estado["modo"] = "erro"
+    for i in range(FALHAS_PARA_ABRIR):
+        try:
+            await consultar_cep(f"1305000{i}")
+        except ViaCEPIndisponivel:
+            pass
+    await asyncio.sleep(SEGUNDOS_ABERTO)
+    try:
+        await consultar_cep("13060000")
+    except ViaCEPIndisponivel:
+        pass
+    _conferir("Passado o tempo aberto, uma nova falha reabre o disjuntor", viacep.disjuntor.aberto)
+    estado["modo"] = "ok"
+
+async def verificar_viacep() -> bool:
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ViaCEPFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    # Cliente apontado para o servidor falso, com cache só em memória e
+    # disjuntor com limites curtos
+    viacep.VIACEP_URL = f"http://127.0.0.1:{servidor.server_port}/ws/{{cep}}/json/"
+    viacep.VIACEP_TIMEOUT = TIMEOUT
+    viacep.cache_cep = CacheCEP(max_itens=1000, ttl=3600, ttl_erro=3600)
+    viacep.disjuntor = Disjuntor(falhas_para_abrir=FALHAS_PARA_ABRIR, segundos_aberto=SEGUNDOS_ABERTO)
+    await viacep.fechar_cliente()
+
+    try:
+        await checar_coalescencia()
+        await checar_disjuntor()
+    finally:
+        await viacep.fechar_cliente()
+        servidor.shutdown()
+    return not falhas
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(verificar_viacep()) else 1)
@@ -0,0 +1,113 @@
+# viacep.py
+import asyncio
+import os
+import time
+import httpx
+from cache import AUSENTE
+from cache_cep import cache_cep
+
+# =========================
+# CLIENTE HTTP DO VIACEP
+# =========================
+# Um único AsyncClient por processo (conexões keep-alive reaproveitadas),
+# timeouts curtos, consultas iguais em andamento agrupadas numa só e um
+# disjuntor (circuit breaker) que para de chamar o ViaCEP quando ele cai.
+
+VIACEP_URL = os.getenv("VIACEP_URL", "https://viacep.com.br/ws/{cep}/json/")
+VIACEP_TIMEOUT = float(os.getenv("VIACEP_TIMEOUT", "3"))
+VIACEP_TIMEOUT_CONEXAO = float(os.getenv("VIACEP_TIMEOUT_CONEXAO", "1.5"))
+VIACEP_MAX_CONEXOES = int(os.getenv("VIACEP_MAX_CONEXOES", "20"))
+
+class ViaCEPIndisponivel(Exception):
+    """ViaCEP fora do ar, lento demais ou com o disjuntor aberto"""
+
+class Disjuntor:
+    """
+    Depois de 'falhas_para_abrir' falhas seguidas, fica aberto por
+    'segundos_aberto' (nenhuma chamada sai). Passado esse tempo as chamadas
+    voltam a sair: um sucesso fecha o disjuntor, uma nova falha reabre.
+    """
+
+    def __init__(self, falhas_para_abrir: int = 5, segundos_aberto: float = 30):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.segundos_aberto = segundos_aberto
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+
+    @property
+    def aberto(self) -> bool:
+        return time.monotonic() < self.aberto_ate
+
+    def permitido(self) -> bool:
+        return not self.aberto
+
+    def registrar_sucesso(self):
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+
+    def registrar_falha(self):
+        self.falhas_seguidas += 1
+        if self.falhas_seguidas >= self.falhas_para_abrir:
+            self.aberto_ate = time.monotonic() + self.segundos_aberto
+
+disjuntor = Disjuntor(
+    falhas_para_abrir=int(os.getenv("VIACEP_FALHAS_PARA_ABRIR", "5")),
+    segundos_aberto=float(os.getenv("VIACEP_SEGUNDOS_ABERTO", "30"))
+)
+
+_cliente = None
+_em_andamento = {}  # cep -> Task da consulta que já está rodando
+
+def obter_cliente() -> httpx.AsyncClient:
+    global _cliente
+    if _cliente is None or _cliente.is_closed:
+        _cliente = httpx.AsyncClient(
+            timeout=httpx.Timeout(VIACEP_TIMEOUT, connect=VIACEP_TIMEOUT_CONEXAO),
+            limits=httpx.Limits(
+                max_connections=VIACEP_MAX_CONEXOES,
+                max_keepalive_connections=VIACEP_MAX_CONEXOES
+            )
+        )
+    return _cliente
+
+async def fechar_cliente():
+    """Chamado no shutdown do app"""
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+async def _buscar_no_viacep(cep: str) -> dict:
+    if not disjuntor.permitido():
+        raise ViaCEPIndisponivel("ViaCEP temporariamente desativado (muitas falhas seguidas)")
+
+    try:
+        resposta = await obter_cliente().get(VIACEP_URL.format(cep=cep))
+        resposta.raise_for_status()
+        dados = resposta.json()
+    except (httpx.HTTPError, ValueError) as e:
+        disjuntor.registrar_falha()
+        raise ViaCEPIndisponivel(f"Erro ao consultar o CEP: {e}")
+
+    disjuntor.registrar_sucesso()
+    await cache_cep.guardar(cep, dados)
+    return dados
+
+async def consultar_cep(cep: str) -> dict:
+    """
+    Dados do ViaCEP para o CEP ({'erro': True} se não existe).
+    Ordem: cache -> consulta já em andamento para o mesmo CEP -> ViaCEP.
+    Levanta ViaCEPIndisponivel se não foi possível consultar.
+    """
+    dados = await cache_cep.buscar(cep)
+    if dados is not AUSENTE:
+        return dados
+
+    tarefa = _em_andamento.get(cep)
+    if tarefa is None:
+        tarefa = asyncio.ensure_future(_buscar_no_viacep(cep))
+        _em_andamento[cep] = tarefa
+        tarefa.add_done_callback(lambda _: _em_andamento.pop(cep, None))
+
+    # shield: se um cliente desconectar, a consulta continua para os outros
+    return await asyncio.shield(tarefa)